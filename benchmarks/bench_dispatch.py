@@ -0,0 +1,63 @@
+"""
+Event dispatch benchmark. Measures how many events per second are passed to a short event listener, on the default
+event loop and uvloop (if installed), with and without eager tasks (Python 3.12+).
+
+    $ python benchmarks/bench_dispatch.py
+"""
+
+import asyncio
+import time
+
+import detache
+
+N = 100000
+
+
+class Counter(detache.Plugin):
+    count = 0
+
+    @detache.event_listener("on_typing")
+    async def typing(self, channel, user, when):
+        Counter.count += 1
+
+
+def measure(**options):
+    bot = detache.Bot(**options)
+    bot.register_plugin(Counter)
+
+    async def run():
+        Counter.count = 0
+        start = time.perf_counter()
+
+        for _ in range(N):
+            await bot.on_typing(None, None, None)
+
+        while Counter.count < N:
+            await asyncio.sleep(0)
+
+        return N / (time.perf_counter() - start)
+
+    try:
+        return bot.loop.run_until_complete(run())
+    finally:
+        bot.loop.run_until_complete(bot.close())
+
+
+def main():
+    runs = [("asyncio", {})]
+
+    if hasattr(asyncio, "eager_task_factory"):
+        runs.append(("asyncio + eager tasks", {"eager_tasks": True}))
+
+    if detache.bot.uvloop is not None:
+        runs.append(("uvloop", {"use_uvloop": True}))
+
+        if hasattr(asyncio, "eager_task_factory"):
+            runs.append(("uvloop + eager tasks", {"use_uvloop": True, "eager_tasks": True}))
+
+    for name, options in runs:
+        print("{}: {:.0f} events/s".format(name, measure(**options)))
+
+
+if __name__ == "__main__":
+    main()
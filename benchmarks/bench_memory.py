@@ -0,0 +1,54 @@
+"""
+Memory benchmark for commands and command contexts.
+
+Reports the number of bytes used by each registered command (with 3 arguments), and by each in-flight command
+invocation (its :class:`detache.Context`).
+
+    $ python benchmarks/bench_memory.py
+"""
+
+import gc
+import tracemalloc
+from types import SimpleNamespace
+
+import detache
+
+N = 10000
+
+
+def make_command(i):
+    @detache.command("cmd{}".format(i), "Benchmark command.")
+    @detache.argument("a", detache.Number)
+    @detache.argument("b", detache.String)
+    @detache.argument("c", detache.User, required=False)
+    async def cmd(self, ctx, a, b, c):
+        return a
+
+    return cmd
+
+
+def measure(func):
+    gc.collect()
+    tracemalloc.start()
+
+    before = tracemalloc.get_traced_memory()[0]
+    kept = func()
+    after = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+
+    return (after - before) / len(kept)
+
+
+def main():
+    per_command = measure(lambda: [make_command(i) for i in range(N)])
+
+    message = SimpleNamespace(guild=object(), channel=object(), author=object())
+    per_context = measure(lambda: [detache.Context(None, message, "!") for _ in range(N)])
+
+    print("bytes per registered command: {:.0f}".format(per_command))
+    print("bytes per in-flight invocation: {:.0f}".format(per_context))
+
+
+if __name__ == "__main__":
+    main()
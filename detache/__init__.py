@@ -19,18 +19,18 @@
 # SOFTWARE.
 
 import logging
-import sys
 
-from detache import util, errors
+from detache import (admin, bulk, checks, compat, counters, diagnostics, errors, http_client, members, resources,
+                     singleflight, toggles, triggers, util)
 from detache.bot import Bot
-from detache.command import Context, command, argument, Any, String, Number, User, Channel, Role
+from detache.command import (Context, CommandCache, MaxConcurrency, command, argument, Any, String, Number, User,
+                             Channel, Role)
+from detache.logs import setup_logging
 from detache.plugin import Plugin
-from detache.wrappers import event_listener, background_task
+from detache.resources import Resource
+from detache.wrappers import event_listener, background_task, check, trigger
 
 __version__ = "0.2.0"
 
-log = logging.getLogger("outlet")
-log.setLevel(logging.DEBUG)
-handler = logging.StreamHandler(sys.stdout)  # logging.FileHandler(filename="outlet.log", encoding="utf-8", mode="w")
-handler.setFormatter(logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s"))
-log.addHandler(handler)
+# nothing is logged until setup_logging is called
+logging.getLogger("outlet").addHandler(logging.NullHandler())
@@ -0,0 +1,79 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+
+import discord
+
+from detache import diagnostics, errors
+from detache.command import command, argument, Number
+from detache.plugin import Plugin
+
+
+class Diagnostics(Plugin):
+    """
+    Admin commands for looking into a running bot. Only the bot's owner can use them. ::
+
+        bot.register_plugin(detache.admin.Diagnostics)
+    """
+
+    __plugin_name__ = "Diagnostics"
+
+    #: longest profile that can be taken, in seconds
+    max_profile = 60
+
+    def __init__(self, bot):
+        super().__init__(bot)
+
+        self.owner_id = None
+        self.profiling = False
+
+    async def check_owner(self, ctx):
+        if self.owner_id is None:
+            self.owner_id = (await self.bot.application_info()).owner.id
+
+        if ctx.author.id != self.owner_id:
+            raise errors.MissingPermissions("Only the bot's owner can use this command.")
+
+    @command("profile")
+    @argument("seconds", Number, required=False, default=10, help="Seconds to profile for")
+    async def profile(self, ctx, seconds):
+        """
+        Profiles the bot, then uploads the samples as collapsed stacks. Open the file with a flame graph viewer like
+        speedscope.
+        """
+
+        await self.check_owner(ctx)
+
+        if self.profiling:
+            return "A profile is already running."
+
+        seconds = min(seconds, self.max_profile)
+
+        self.profiling = True
+        try:
+            await ctx.send("Profiling for {} seconds...".format(seconds))
+
+            stacks = await diagnostics.Profiler(self.bot).run(seconds)
+        finally:
+            self.profiling = False
+
+        await ctx.send(file=discord.File(io.BytesIO(stacks.encode("utf-8")), "profile.folded"))
@@ -18,12 +18,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
 import logging
-import discord
+import time
+
 import aiohttp
+import discord
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from detache.command import Context
-from detache import errors
+from detache.checks import CheckPipeline
+from detache.counters import CounterStore
+from detache.gateway import SessionStore
+from detache.http_client import HTTPClient
+from detache.plugin import guild_id_of
+from detache.members import MemberCache
+from detache.resources import ResourceRegistry
+from detache.snapshot import SnapshotFile
+from detache.toggles import GuildToggles
+from detache.triggers import TriggerIndex
+from detache import diagnostics, errors, snapshot, util
 
 import inspect
 
@@ -36,17 +54,59 @@ class Bot(discord.Client):
 
     :keyword str default_prefix: (Optional) Default bot prefix. This can be overrided for per-server prefixes.
     :keyword logger: Logging object. The Detache log is used by default.
+    :keyword dict http_options: (Optional) Keywords for the :class:`detache.http_client.HTTPClient` shared by plugins.
+    :keyword bool use_uvloop: (Optional) If True and uvloop is installed, the bot runs on a new uvloop event loop, at
+                              :attr:`loop`. The global event loop policy isn't changed.
+    :keyword bool eager_tasks: (Optional) If True and supported (Python 3.12+), tasks start running as soon as they're
+                               created, so short event listeners finish without waiting for the next loop iteration.
+    :keyword toggle_store: (Optional) :class:`detache.toggles.ToggleStore` that per-guild plugin and command toggles are
+                           loaded from and saved to.
+    :keyword str dm_prefix: (Optional) Command prefix in direct messages. Defaults to default_prefix. Per-guild prefixes
+                            aren't used in DMs.
+    :keyword bool dm_prefix_required: (Optional) If False, commands can be used in DMs without the prefix.
+    :keyword str session_file: (Optional) File the gateway session is saved to when the bot closes, and resumed from
+                               when it starts. Needs raw_events_only.
+    :keyword bool raw_events_only: (Optional) Must be True to use session_file. A bot resumed in a new process never
+                                   gets READY or its guilds, so :attr:`user` is None, discord.py's caches stay empty,
+                                   wait_until_ready never returns, and guild messages don't run commands. Only plugins
+                                   that work from raw events and the API keep working.
+    :keyword str snapshot_file: (Optional) File that toggles, command caches and plugin state are saved to when the bot
+                                closes, and restored from when it starts. See :class:`detache.snapshot.SnapshotFile`
     """
 
-    def __init__(self, *, default_prefix="!", logger=default_log):
-        super().__init__()
+    def __init__(self, *, default_prefix="!", logger=default_log, http_options=None, use_uvloop=False,
+                 eager_tasks=False, toggle_store=None, dm_prefix=None, dm_prefix_required=True, session_file=None,
+                 raw_events_only=False, snapshot_file=None):
+        loop = None
+
+        if use_uvloop:
+            if uvloop is not None:
+                # only this bot's loop, the event loop policy and the thread's current loop are left alone
+                loop = uvloop.new_event_loop()
+            else:
+                logger.warning("uvloop isn't installed, using the default event loop")
+
+        super().__init__(loop=loop)
 
         self.log = logger
 
-        self.http_session = aiohttp.ClientSession()
+        if eager_tasks:
+            if hasattr(asyncio, "eager_task_factory"):
+                self.loop.set_task_factory(asyncio.eager_task_factory)
+            else:
+                self.log.warning("eager tasks aren't supported by this version of Python")
+
+        #: :class:`detache.http_client.HTTPClient` shared by plugins that don't set their own http options
+        self.http_session = HTTPClient(**(http_options or {}))
+
+        #: :class:`detache.resources.ResourceRegistry` of pools shared by plugins
+        self.resources = ResourceRegistry()
 
         self.default_prefix = default_prefix
 
+        self.dm_prefix = default_prefix if dm_prefix is None else dm_prefix
+        self.dm_prefix_required = dm_prefix_required
+
         async def get_prefix(guild):
             return self.default_prefix
 
@@ -56,19 +116,108 @@ class Bot(discord.Client):
 
         self.commands = {}
 
+        #: :class:`detache.util.SessionManager` used by paged embeds and other reaction menus
+        self.sessions = util.SessionManager()
+
+        #: :class:`detache.diagnostics.Watchdog`, if enabled
+        self.watchdog = None
+
+        #: :class:`detache.members.MemberCache`, if the member cache is limited
+        self.member_cache = None
+
+        #: :class:`detache.counters.CounterStore`, if enabled
+        self.counters = None
+
+        #: :class:`detache.toggles.GuildToggles` for enabling and disabling plugins and commands per guild
+        self.toggles = GuildToggles(toggle_store)
+
+        #: :class:`detache.checks.CheckPipeline` of checks run on messages before looking for a command
+        self.checks = CheckPipeline()
+
+        #: :class:`detache.triggers.TriggerIndex` of every plugin's triggers
+        self.triggers = TriggerIndex()
+
+        if session_file is not None:
+            if not raw_events_only:
+                raise ValueError("session_file needs raw_events_only=True, since a resumed bot has no guilds cached")
+
+            from discord import gateway
+
+            if not hasattr(gateway, "ReconnectWebSocket"):
+                raise ValueError("session_file needs discord.py 1.4 or later")
+
+        #: :class:`detache.gateway.SessionStore` the gateway session is saved to, if session_file was passed
+        self.gateway_sessions = SessionStore(session_file) if session_file is not None else None
+
+        #: :class:`detache.snapshot.SnapshotFile` caches are saved to, if snapshot_file was passed
+        self.snapshots = SnapshotFile(snapshot_file, logger=logger) if snapshot_file is not None else None
+
+        #: plugin name -> seconds its :meth:`Plugin.__setup__` took
+        self.startup_times = {}
+
+        self._set_up = []  # plugins in the order they finished setting up
+
+        self._closing = False
+
     def register_plugin(self, plugin, name=None):
         """
         Registers plugin to the bot.
 
         :param plugin: Plugin class. Must inherit :class:`detache.Plugin`
-        :param str name: (Optional) Name of the plugin.
+        :param str name: (Optional) Name of the plugin. Defaults to its ``__plugin_name__``, or its class name.
+        :raises: :class:`detache.errors.DetacheException` if there's already a plugin with the name.
         """
 
         plugin = plugin(self)  # init plugin
 
+        if name is not None:
+            plugin.__plugin_name__ = name
+
+        # toggles, setup order, cpu times and snapshots all find plugins by name
+        if self.get_plugin(plugin.__plugin_name__) is not None:
+            raise errors.DetacheException("There's already a plugin named {}.".format(plugin.__plugin_name__))
+
+        self.toggles.set_default("plugin", plugin.__plugin_name__, plugin.__enabled_by_default__)
+
         self.plugins.append(plugin)  # add to list
         self.commands.update(**plugin.commands)  # add commands to dict
 
+        for trigger in plugin.triggers:
+            self.triggers.add(plugin, trigger)
+
+    def plugins_for(self, guild_id):
+        """
+        Returns the plugins enabled in a guild.
+
+        :param int guild_id: Guild ID, or None for events that didn't happen in a guild.
+        """
+
+        if guild_id is None:
+            return self.plugins
+
+        return [plugin for plugin in self.plugins if self.toggles.enabled(guild_id, "plugin", plugin.__plugin_name__)]
+
+    def dispatch_plugins(self, event, *args, **kwargs):
+        """
+        Passes an event to the event listeners of every plugin enabled in the guild it happened in.
+
+        :param str event: Event name, i.e. "on_message_delete"
+        """
+
+        for plugin in self.plugins_for(guild_id_of(args)):
+            self.loop.create_task(plugin.__on_event__(event, *args, **kwargs))
+
+    def get_plugin(self, name):
+        """
+        Returns the registered plugin with a name, or None.
+
+        :param str name: Name of the plugin.
+        """
+
+        for plugin in self.plugins:
+            if plugin.__plugin_name__ == name:
+                return plugin
+
     def plugin(self, name=None):
         """
         Plugin decorator for use in single file bots. Put this decorator before a plugin class for it to be registered
@@ -111,48 +260,491 @@ class Bot(discord.Client):
         # update with new func
         self.get_prefix = get_prefix
 
+    def check(self, func):
+        """
+        Adds a global check, which is called with every message before the bot looks for a command in it. If it
+        doesn't return a truthy value, the message isn't checked for a command. If it raises
+        :class:`detache.errors.CheckFailure`, the error is sent to the channel instead. Plugins and triggers still
+        receive the message either way. ::
+
+            @bot.check
+            def not_a_bot(message):
+                return not message.author.bot
+
+        This decorator can be used on functions or coroutines. Functions are run first, and coroutines only run if all
+        of the functions pass.
+        """
+
+        self.checks.add(func)
+
+        return func
+
+    def enable_watchdog(self, **kwargs):
+        """
+        Watches the event loop for lag, and keeps track of the cpu time used by each plugin. Call this before starting
+        the bot. Takes the same keywords as :class:`detache.diagnostics.Watchdog`.
+
+        :returns: :class:`detache.diagnostics.Watchdog`
+        """
+
+        self.watchdog = diagnostics.Watchdog(self, logger=self.log, **kwargs)
+
+        return self.watchdog
+
+    def limit_member_cache(self, **kwargs):
+        """
+        Limits discord.py's member cache to members seen recently, to save memory on large bots. Members that aren't
+        cached are fetched when a command needs them. Call this before starting the bot. Takes the same keywords as
+        :class:`detache.members.MemberCache`.
+
+        :returns: :class:`detache.members.MemberCache`
+        """
+
+        self.member_cache = MemberCache(self, logger=self.log, **kwargs)
+
+        return self.member_cache
+
+    def enable_counters(self, backend=None, **kwargs):
+        """
+        Adds a write-behind store of counters and leaderboards for plugins at :attr:`counters`. It's loaded when the
+        bot starts, and flushed when it closes. Call this before starting the bot. Takes the same arguments as
+        :class:`detache.counters.CounterStore`.
+
+        :returns: :class:`detache.counters.CounterStore`
+        """
+
+        self.counters = CounterStore(backend, logger=self.log, **kwargs)
+
+        return self.counters
+
+    def cpu_times(self):
+        """
+        Returns the cpu time used by each plugin. See :func:`detache.diagnostics.cpu_times`
+        """
+
+        return diagnostics.cpu_times(self.plugins)
+
+    async def process_command(self, command_object, ctx, args):
+        start = time.perf_counter()
+
+        # attempt command
+        try:
+            await ctx.plugin.timed(command_object.process(ctx, args), "command", command_object.name)
+        except errors.CommandError as e:  # parsing error, i.e. wrong arg type
+            await ctx.send(e)
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("command finished", extra={
+                "kind": "command",
+                "guild": ctx.guild.id if ctx.guild is not None else None,
+                "command": command_object.name,
+                "latency": round(time.perf_counter() - start, 6),
+            })
+
+    def setup_order(self):
+        """
+        Returns the plugins ordered so each comes after the plugins it requires.
+
+        :raises: :class:`detache.errors.DetacheException` if a required plugin isn't registered, or plugins require
+                 each other.
+        """
+
+        plugins = {plugin.__plugin_name__: plugin for plugin in self.plugins}
+
+        order = []
+        state = {}  # name -> False while visiting its requirements, True once ordered
+
+        def visit(plugin, path):
+            name = plugin.__plugin_name__
+
+            if state.get(name) is True:
+                return
+            if state.get(name) is False:
+                raise errors.DetacheException("Plugins require each other: {}".format(" -> ".join(path + [name])))
+
+            state[name] = False
+
+            for required in plugin.__requires__:
+                if required not in plugins:
+                    raise errors.DetacheException("{} requires {}, which isn't registered.".format(name, required))
+
+                visit(plugins[required], path + [name])
+
+            state[name] = True
+            order.append(plugin)
+
+        for plugin in self.plugins:
+            visit(plugin, [])
+
+        return order
+
+    async def setup_plugins(self):
+        """
+        Coroutine
+
+        Runs every plugin's :meth:`Plugin.__setup__`. Plugins that don't require each other are set up concurrently.
+        Called by :meth:`start`.
+        """
+
+        start = time.perf_counter()
+
+        tasks = {}
+
+        async def setup(plugin):
+            for required in plugin.__requires__:
+                await tasks[required]
+
+            plugin_start = time.perf_counter()
+
+            await plugin.__setup__()
+
+            self.startup_times[plugin.__plugin_name__] = time.perf_counter() - plugin_start
+            self._set_up.append(plugin)
+
+        # tasks are created in setup order, so required tasks always exist even if tasks start eagerly
+        for plugin in self.setup_order():
+            tasks[plugin.__plugin_name__] = self.loop.create_task(setup(plugin))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+
+            raise
+
+        self.log.info("set up %d plugins in %.3fs", len(tasks), time.perf_counter() - start)
+
+        for name, seconds in sorted(self.startup_times.items(), key=lambda item: -item[1]):
+            self.log.debug("%s set up in %.3fs", name, seconds)
+
+    async def teardown_plugins(self):
+        """
+        Coroutine
+
+        Runs :meth:`Plugin.__teardown__` for every plugin that was set up, in reverse order. Called by :meth:`close`.
+        """
+
+        while self._set_up:
+            plugin = self._set_up.pop()
+
+            try:
+                await plugin.__teardown__()
+            except Exception:
+                self.log.exception("error tearing down %r", plugin)
+
+    def snapshot(self):
+        """
+        Returns the state saved in snapshots: toggles, cached command replies, and each plugin's
+        :meth:`Plugin.__snapshot__`. Plugins whose state raises or can't be pickled are left out, and logged.
+        """
+
+        plugins = {}  # plugin name (unique per bot) -> state
+        for plugin in self.plugins:
+            try:
+                state = plugin.__snapshot__()
+            except Exception:
+                self.log.exception("error taking snapshot of %r", plugin)
+                continue
+
+            if state is None:
+                continue
+
+            if not snapshot.picklable(state):
+                self.log.error("snapshot of %r can't be pickled, leaving it out", plugin)
+                continue
+
+            plugins[plugin.__plugin_name__] = state
+
+        return {
+            "toggles": self.toggles.snapshot(),
+            "caches": {name: command.cache.snapshot() for name, command in self.commands.items()
+                       if command.cache is not None},
+            "plugins": plugins,
+        }
+
+    def restore(self, state, age):
+        """
+        Restores state from :meth:`snapshot`.
+
+        :param float age: Seconds since the snapshot was taken.
+        """
+
+        self.toggles.restore(state["toggles"])
+
+        for name, entries in state["caches"].items():
+            command = self.commands.get(name)
+
+            if command is not None and command.cache is not None:
+                command.cache.restore(entries, age)
+
+        for plugin in self.plugins:
+            plugin_state = state["plugins"].get(plugin.__plugin_name__)
+
+            if plugin_state is not None:
+                try:
+                    plugin.__restore__(plugin_state, age)
+                except Exception:
+                    self.log.exception("error restoring %r from snapshot", plugin)
+
+    async def start(self, *args, **kwargs):
+        if self.snapshots is not None:
+            loaded = await self.loop.run_in_executor(None, self.snapshots.load)
+
+            if loaded is not None:
+                self.restore(*loaded)
+                self.log.info("restored snapshot from %.0fs ago", loaded[1])
+
+        await self.toggles.load()
+
+        if self.counters is not None:
+            await self.counters.start()
+
+        await self.setup_plugins()
+
+        if self.watchdog is not None:
+            self.watchdog.start()
+
+        if self.member_cache is not None:
+            self.member_cache.start()
+
+        await super().start(*args, **kwargs)
+
+    def command_enabled(self, guild_id, command_object):
+        """
+        Returns whether a command, and the plugin it belongs to, are enabled in a guild.
+        """
+
+        return (self.toggles.enabled(guild_id, "plugin", command_object.plugin.__plugin_name__)
+                and self.toggles.enabled(guild_id, "command", command_object.name))
+
+    async def connect(self, *, reconnect=True):
+        session = None
+        if self.gateway_sessions is not None:
+            session = await self.loop.run_in_executor(None, self.gateway_sessions.pop, self.shard_id)
+
+        if session is not None:
+            # only in discord.py 1.4+, so it's only imported by bots that resume sessions
+            from discord.gateway import DiscordWebSocket, ReconnectWebSocket
+
+        # resume the saved session. if it can't be resumed, discord.py connects and identifies as usual
+        while session is not None and not self.is_closed():
+            session_id, sequence = session
+
+            try:
+                coroutine = DiscordWebSocket.from_client(self, shard_id=self.shard_id, session=session_id,
+                                                         sequence=sequence, resume=True)
+                self.ws = await asyncio.wait_for(coroutine, timeout=60.0)
+
+                self.log.info("resuming gateway session %s", session_id)
+
+                while True:
+                    await self.ws.poll_event()
+            except ReconnectWebSocket as e:
+                self.dispatch("disconnect")
+
+                session = (self.ws.session_id, self.ws.sequence) if e.resume else None
+            except (OSError, discord.HTTPException, discord.GatewayNotFound, discord.ConnectionClosed,
+                    aiohttp.ClientError, asyncio.TimeoutError):
+                self.dispatch("disconnect")
+
+                if self.is_closed():
+                    return
+
+                session = None
+
+        if not self.is_closed():
+            await super().connect(reconnect=reconnect)
+
+    async def save_session(self):
+        """
+        Coroutine
+
+        Saves the gateway session and closes the connection without ending the session, so it can be resumed. Called
+        by :meth:`close` if the bot has a session_file.
+        """
+
+        ws = self.ws
+
+        if ws is None or not ws.open or ws.session_id is None:
+            return
+
+        await self.loop.run_in_executor(None, self.gateway_sessions.save, self.shard_id, ws.session_id, ws.sequence)
+
+        await ws.close(code=4000)  # closing with 1000 or 1001 would end the session
+
+    def is_closed(self):
+        # closing counts as closed, so the connection closed to save the session isn't reconnected
+        return self._closing or super().is_closed()
+
+    def clear(self):
+        self._closing = False
+
+        super().clear()
+
+    async def close(self):
+        if self.is_closed():
+            return
+
+        self._closing = True
+
+        if self.gateway_sessions is not None:
+            await self.save_session()
+
+        if self.snapshots is not None:
+            try:
+                await self.loop.run_in_executor(None, self.snapshots.save, self.snapshot())
+            except Exception:
+                self.log.exception("error saving snapshot")
+
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+        if self.member_cache is not None:
+            self.member_cache.stop()
+
+        await self.teardown_plugins()
+
+        if self.counters is not None:
+            try:
+                await self.counters.close()
+            except Exception:
+                self.log.exception("error flushing counters")
+
+        for plugin in self.plugins:
+            plugin.lanes.close()
+
+            if plugin.http is not self.http_session:
+                await plugin.http.close()
+
+        await self.http_session.close()
+
+        await self.resources.close()
+
+        await super().close()
+
     # event handling
 
-    async def on_message(self, message):
-        if isinstance(message.channel, discord.TextChannel) and message.author != self.user:
-            # happened in a guild, could be a command
+    @staticmethod
+    def split_command(content):
+        # split up command and args
+        split = content.split(" ")
+
+        cmd = split[0]
+        args = " ".join(split[1:]) if len(split) > 0 else ""  # put args back together
 
-            prefix = await self.get_prefix(message.guild)
+        return cmd, args
 
-            content = message.content
-            if content.startswith(prefix) and content != prefix:
-                self.log.debug("command called: {!r}".format(message.content))
+    async def on_message(self, message):
+        checks = self.checks
 
-                split = content[len(prefix):].split(" ")  # remove prefix, split up args and command
+        if isinstance(message.channel, discord.TextChannel):
+            in_guild = True
 
-                cmd = split[0]
-                args = " ".join(split[1:]) if len(split) > 0 else ""  # put args back together
+            if self.member_cache is not None and isinstance(message.author, discord.Member):
+                self.member_cache.seen(message.author)
+        elif isinstance(message.channel, discord.DMChannel):
+            in_guild = False
+        else:
+            in_guild = None  # group DMs
 
-                # check if command exists
-                if cmd in self.commands:
-                    command_object = self.commands[cmd]
+        if in_guild is not None and message.author != self.user:
+            try:
+                passed = checks.run_sync(message) and (not checks.has_async or await checks.run_async(message))
+            except errors.CommandError as e:  # check failed with a message
+                passed = False
 
-                    # create command context
-                    ctx = Context(command_object.plugin, message, prefix)
+                await message.channel.send(e)
 
-                    # attempt command
-                    try:
-                        await command_object.process(ctx, args)
-                    except errors.CommandError as e:  # parsing error, i.e. wrong arg type
-                        await message.channel.send(e)
+            if passed:
+                if in_guild:
+                    await self.process_guild_message(message)
                 else:
-                    # command does not exist!!
-                    await message.channel.send("{}**{}** isn't a command.".format(prefix, cmd))
+                    await self.process_dm_message(message)
 
-        for plugin in self.plugins:
+        guild_id = guild_id_of((message,))
+
+        for plugin in self.plugins_for(guild_id):
             self.loop.create_task(plugin.__on_event__("on_message", message))
             self.loop.create_task(plugin.__on_message__(message))
 
+        if len(self.triggers) and message.author != self.user:
+            self.dispatch_triggers(guild_id, message)
+
+    def dispatch_triggers(self, guild_id, message):
+        # one search for every plugin's triggers, then only matching triggers get a task
+
+        for plugin, trigger, match in self.triggers.search(message.content):
+            if guild_id is None or self.toggles.enabled(guild_id, "plugin", plugin.__plugin_name__):
+                coroutine = plugin.timed(trigger.func(plugin, message, match), "trigger", trigger.func.__name__)
+
+                self.loop.create_task(coroutine)
+
+    async def process_dm_message(self, message):
+        # DMs use a static prefix and skip guild lookups, toggles and lanes
+
+        prefix = self.dm_prefix
+        content = message.content
+
+        if prefix and content.startswith(prefix) and content != prefix:
+            content = content[len(prefix):]
+        elif self.dm_prefix_required:
+            return
+        else:
+            prefix = ""
+
+        self.log.debug("command called in DM: %r", content, extra={"kind": "command"})
+
+        cmd, args = self.split_command(content)
+
+        command_object = self.commands.get(cmd)
+
+        if command_object is None:
+            if prefix:  # without a prefix, it was probably just a message
+                await message.channel.send("{}**{}** isn't a command.".format(prefix, cmd))
+        elif not command_object.dm_allowed:
+            await message.channel.send("{}**{}** can only be used in a server.".format(prefix, cmd))
+        else:
+            await self.process_command(command_object, Context(command_object.plugin, message, prefix), args)
+
+    async def process_guild_message(self, message):
+        # happened in a guild, could be a command
+
+        prefix = await self.get_prefix(message.guild)
+
+        content = message.content
+        if content.startswith(prefix) and content != prefix:
+            self.log.debug("command called: %r", content, extra={"kind": "command", "guild": message.guild.id})
+
+            cmd, args = self.split_command(content[len(prefix):])  # remove prefix
+
+            # check if command exists
+            if cmd in self.commands:
+                command_object = self.commands[cmd]
+
+                if self.command_enabled(message.guild.id, command_object):  # ignored if disabled in this guild
+                    # create command context
+                    ctx = Context(command_object.plugin, message, prefix)
+
+                    if command_object.ordered:  # run in the guild's lane
+                        lanes = command_object.plugin.lanes
+                        lanes.submit(message.guild.id, self.process_command(command_object, ctx, args))
+                    else:
+                        await self.process_command(command_object, ctx, args)
+            else:
+                # command does not exist!!
+                await message.channel.send("{}**{}** isn't a command.".format(prefix, cmd))
+
     async def on_ready(self):
         for plugin in self.plugins:
             self.loop.create_task(plugin.__on_event__("on_ready"))
             self.loop.create_task(plugin.__on_ready__())
 
+    async def on_resumed(self):
+        for plugin in self.plugins:
+            self.loop.create_task(plugin.__on_event__("on_resumed"))
+            self.loop.create_task(plugin.__on_resumed__())
+
     async def on_shard_ready(self):
         for plugin in self.plugins:
             self.loop.create_task(plugin.__on_event__("on__shard_ready"))
@@ -161,127 +753,102 @@ class Bot(discord.Client):
     # passthrough
 
     async def on_typing(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_typing", *args, **kwargs))
+        self.dispatch_plugins("on_typing", *args, **kwargs)
 
     # messages
 
     async def on_message_delete(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_message_delete", *args, **kwargs))
+        self.dispatch_plugins("on_message_delete", *args, **kwargs)
 
     async def on_raw_message_delete(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_raw_message_delete", *args, **kwargs))
+        self.dispatch_plugins("on_raw_message_delete", *args, **kwargs)
 
     async def on_message_edit(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_message_edit", *args, **kwargs))
+        self.dispatch_plugins("on_message_edit", *args, **kwargs)
 
     # reactions
 
-    async def on_reaction_add(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_reaction_add", *args, **kwargs))
+    async def on_reaction_add(self, reaction, user):
+        self.dispatch_plugins("on_reaction_add", reaction, user)
+
+        await self.sessions.dispatch(reaction, user)
 
     async def on_reaction_remove(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_reaction_remove", *args, **kwargs))
+        self.dispatch_plugins("on_reaction_remove", *args, **kwargs)
 
     async def on_reaction_clear(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_reaction_clear", *args, **kwargs))
+        self.dispatch_plugins("on_reaction_clear", *args, **kwargs)
 
     # private channels
 
     async def on_private_channel_delete(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_private_channel_delete", *args, **kwargs))
+        self.dispatch_plugins("on_private_channel_delete", *args, **kwargs)
 
     async def on_private_channel_create(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_private_channel_create", *args, **kwargs))
+        self.dispatch_plugins("on_private_channel_create", *args, **kwargs)
 
     async def on_private_channel_update(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_private_channel_update", *args, **kwargs))
+        self.dispatch_plugins("on_private_channel_update", *args, **kwargs)
 
     # guild channels
 
     async def on_guild_channel_delete(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_channel_delete", *args, **kwargs))
+        self.dispatch_plugins("on_guild_channel_delete", *args, **kwargs)
 
     async def on_guild_channel_create(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_channel_create", *args, **kwargs))
+        self.dispatch_plugins("on_guild_channel_create", *args, **kwargs)
 
     async def on_guild_channel_update(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_channel_update", *args, **kwargs))
+        self.dispatch_plugins("on_guild_channel_update", *args, **kwargs)
 
     # members
 
     async def on_member_join(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_member_join", *args, **kwargs))
+        self.dispatch_plugins("on_member_join", *args, **kwargs)
 
     async def on_member_remove(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_member_remove", *args, **kwargs))
+        self.dispatch_plugins("on_member_remove", *args, **kwargs)
 
     async def on_member_update(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_member_update", *args, **kwargs))
+        self.dispatch_plugins("on_member_update", *args, **kwargs)
 
     async def on_member_ban(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_member_ban", *args, **kwargs))
+        self.dispatch_plugins("on_member_ban", *args, **kwargs)
 
     async def on_member_unban(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_member_unban", *args, **kwargs))
+        self.dispatch_plugins("on_member_unban", *args, **kwargs)
 
     # guilds
 
     async def on_guild_join(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_join", *args, **kwargs))
+        self.dispatch_plugins("on_guild_join", *args, **kwargs)
 
     async def on_guild_remove(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_remove", *args, **kwargs))
+        self.dispatch_plugins("on_guild_remove", *args, **kwargs)
 
     async def on_guild_update(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_update", *args, **kwargs))
+        self.dispatch_plugins("on_guild_update", *args, **kwargs)
 
     # roles
 
     async def on_guild_role_create(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_role_create", *args, **kwargs))
+        self.dispatch_plugins("on_guild_role_create", *args, **kwargs)
 
     async def on_guild_role_delete(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_role_delete", *args, **kwargs))
+        self.dispatch_plugins("on_guild_role_delete", *args, **kwargs)
 
     async def on_guild_role_update(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_role_update", *args, **kwargs))
+        self.dispatch_plugins("on_guild_role_update", *args, **kwargs)
 
     # emojis
 
     async def on_guild_emojis_update(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_emojis_update", *args, **kwargs))
+        self.dispatch_plugins("on_guild_emojis_update", *args, **kwargs)
 
     # guild availability
 
     async def on_guild_available(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_available", *args, **kwargs))
+        self.dispatch_plugins("on_guild_available", *args, **kwargs)
 
     async def on_guild_unavailable(self, *args, **kwargs):
-        for plugin in self.plugins:
-            self.loop.create_task(plugin.__on_event__("on_guild_unavailable", *args, **kwargs))
+        self.dispatch_plugins("on_guild_unavailable", *args, **kwargs)
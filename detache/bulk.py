@@ -0,0 +1,347 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import inspect
+import logging
+import time
+from collections import OrderedDict, deque
+
+import discord
+
+from detache.util import Checkpoint, TokenBucket
+
+default_log = logging.getLogger("outlet")
+
+#: statuses that are retried
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ItemResult(object):
+    """
+    Result of a bulk operation on one item.
+
+    :attr item: The item.
+    :attr bool ok: True if the operation succeeded, False if it failed, or None if it was skipped because the
+                   checkpoint says it was already done.
+    :attr value: What the operation returned.
+    :attr error: Exception the operation failed with.
+    :attr int attempts: Times the operation was tried.
+    """
+
+    __slots__ = ["item", "ok", "value", "error", "attempts"]
+
+    def __init__(self, item, ok=None, value=None, error=None, attempts=0):
+        self.item = item
+
+        self.ok = ok
+        self.value = value
+        self.error = error
+
+        self.attempts = attempts
+
+    def __repr__(self):
+        return "ItemResult({!r}, ok={})".format(self.item, self.ok)
+
+
+class BulkResult(object):
+    """
+    Results of a bulk operation, in the same order as the items.
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok is True]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.ok is False]
+
+    @property
+    def skipped(self):
+        return [result for result in self.results if result.ok is None]
+
+    def __repr__(self):
+        return "BulkResult(succeeded={}, failed={}, skipped={})".format(len(self.succeeded), len(self.failed),
+                                                                        len(self.skipped))
+
+
+def _retry_after(error, attempt, backoff):
+    # seconds to wait before retrying a failed request, or None if it shouldn't be retried
+    if not isinstance(error, discord.HTTPException) or error.status not in RETRY_STATUSES:
+        return None
+
+    retry_after = None
+
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return backoff * 2 ** attempt
+
+
+def _is_global(error):
+    response = getattr(error, "response", None)
+
+    return response is not None and response.headers.get("X-RateLimit-Global") is not None
+
+
+async def run(items, operation, *, key=None, bucket=None, per_bucket=1, concurrency=10, rate=40, retries=3,
+              backoff=1.0, checkpoint=None, on_progress=None, logger=default_log):
+    """
+    Coroutine
+
+    Runs an operation on many items, without waiting for each one before starting the next, while staying inside
+    Discord's rate limits. ::
+
+        result = await detache.bulk.run(members, lambda member: member.edit(nick=None),
+                                        bucket=lambda member: member.guild.id)
+
+    discord.py handles one request at a time per rate limit bucket, so items are grouped by bucket and at most
+    per_bucket of each group run at once. Requests that hit a rate limit or a server error are retried after the
+    Retry-After the API asked for.
+
+    :param items: Iterable of items.
+    :param operation: Coroutine function called with each item.
+    :param key: (Optional) Function that returns a unique, JSON serializable key for an item, used by the checkpoint.
+                Defaults to the item's id.
+    :param bucket: (Optional) Function that returns the rate limit bucket an item's request is in, i.e. the guild ID
+                   for member edits. By default, each item is its own bucket.
+    :param int per_bucket: (Optional) Most operations running at once in a bucket. Defaults to 1.
+    :param int concurrency: (Optional) Most operations running at once. Defaults to 10.
+    :param float rate: (Optional) Most operations started per second, to stay under the global rate limit. Defaults to
+                       40. None for no limit.
+    :param int retries: (Optional) Times a rate limited or failed request is retried. Defaults to 3.
+    :param float backoff: (Optional) Seconds before the first retry when the API doesn't say. Doubles for each retry.
+    :param str checkpoint: (Optional) Path of a :class:`detache.util.Checkpoint` file. Items done in an earlier,
+                           interrupted run are skipped. The file is removed when every item succeeds.
+    :param on_progress: (Optional) Function or coroutine function called with (done, total) after each item.
+    :param logger: (Optional) Logging object.
+    :returns: :class:`BulkResult`
+    """
+
+    items = list(items)
+
+    if key is None:
+        key = lambda item: getattr(item, "id", item)
+    if bucket is None:
+        bucket = key
+
+    results = [ItemResult(item) for item in items]
+
+    checkpoint = Checkpoint(checkpoint) if checkpoint is not None else None
+    done_keys = set(checkpoint.load().get("done", ())) if checkpoint is not None else set()
+
+    pending = OrderedDict()  # bucket -> deque of item indexes
+    for index, item in enumerate(items):
+        if done_keys and key(item) in done_keys:
+            continue
+
+        pending.setdefault(bucket(item), deque()).append(index)
+
+    total = len(items)
+    done = total - sum(len(indexes) for indexes in pending.values())
+
+    ready = deque(pending)  # buckets with items waiting and room for another operation
+    active = dict.fromkeys(pending, 0)
+    wake = asyncio.Event()
+
+    # spaced out evenly, without a burst. a global rate limit pauses every operation
+    pacer = TokenBucket(rate, burst=1)
+
+    async def attempt(result):
+        item = result.item
+
+        while True:
+            await pacer.acquire()
+
+            result.attempts += 1
+
+            try:
+                result.value = await operation(item)
+            except Exception as e:
+                delay = _retry_after(e, result.attempts - 1, backoff)
+
+                if delay is None or result.attempts > retries:
+                    result.ok = False
+                    result.error = e
+
+                    return
+
+                if _is_global(e):
+                    pacer.pause(delay)
+
+                logger.debug("bulk operation on %r retrying in %.2fs", item, delay)
+                await asyncio.sleep(delay)  # holds the bucket's slot, so the bucket waits too
+            else:
+                result.ok = True
+
+                return
+
+    async def work():
+        nonlocal done
+
+        while pending:
+            if not ready:
+                wake.clear()
+                await wake.wait()
+                continue
+
+            bucket_key = ready.popleft()
+            indexes = pending[bucket_key]
+
+            index = indexes.popleft()
+            active[bucket_key] += 1
+
+            if indexes and active[bucket_key] < per_bucket:
+                ready.append(bucket_key)
+
+            result = results[index]
+            await attempt(result)
+
+            active[bucket_key] -= 1
+
+            if not indexes:
+                if not active[bucket_key]:
+                    del pending[bucket_key]
+                    del active[bucket_key]
+            elif active[bucket_key] == per_bucket - 1:  # bucket has room again
+                ready.append(bucket_key)
+
+            wake.set()
+
+            done += 1
+
+            if result.ok and checkpoint is not None:
+                done_keys.add(key(result.item))
+
+                if len(done_keys) % 50 == 0:
+                    checkpoint.data["done"] = list(done_keys)
+                    checkpoint.save()
+
+            if on_progress is not None:
+                progress = on_progress(done, total)
+
+                if inspect.isawaitable(progress):
+                    await progress
+
+    try:
+        await asyncio.gather(*(work() for _ in range(concurrency)))
+    finally:
+        if checkpoint is not None:
+            if all(result.ok is not False for result in results) and done == total:
+                checkpoint.remove()
+            else:
+                checkpoint.data["done"] = list(done_keys)
+                checkpoint.save()
+
+    return BulkResult(results)
+
+
+async def add_roles(members, *roles, reason=None, **kwargs):
+    """
+    Coroutine
+
+    Adds roles to many members. Takes the same keywords as :func:`run`.
+
+    :returns: :class:`BulkResult` of the members.
+    """
+
+    return await run(members, lambda member: member.add_roles(*roles, reason=reason),
+                     bucket=lambda member: member.guild.id, **kwargs)
+
+
+async def remove_roles(members, *roles, reason=None, **kwargs):
+    """
+    Coroutine
+
+    Removes roles from many members. Takes the same keywords as :func:`run`.
+
+    :returns: :class:`BulkResult` of the members.
+    """
+
+    return await run(members, lambda member: member.remove_roles(*roles, reason=reason),
+                     bucket=lambda member: member.guild.id, **kwargs)
+
+
+async def mass_dm(users, *args, **kwargs):
+    """
+    Coroutine
+
+    Sends a direct message to many users. Takes the same arguments as :meth:`discord.User.send`, and the same keywords
+    as :func:`run` prefixed with ``bulk_``, i.e. ``bulk_checkpoint``.
+
+    :returns: :class:`BulkResult` of the users. Users with DMs closed fail with :class:`discord.Forbidden`.
+    """
+
+    options = {name[5:]: kwargs.pop(name) for name in list(kwargs) if name.startswith("bulk_")}
+    options.setdefault("rate", 5)  # opening lots of DM channels quickly looks like spam to Discord
+
+    return await run(users, lambda user: user.send(*args, **kwargs), **options)
+
+
+async def bulk_delete(channel, messages, **kwargs):
+    """
+    Coroutine
+
+    Deletes many messages from a channel. Messages newer than 14 days are deleted 100 at a time; older ones, which
+    Discord can't bulk delete, one at a time. Takes the same keywords as :func:`run`.
+
+    :returns: :class:`BulkResult` of the messages.
+    """
+
+    # a little under 14 days, so messages don't become too old while waiting. compared as a snowflake, so it doesn't
+    # matter whether discord.py's created_at is naive or aware
+    cutoff = int((time.time() - 14 * 24 * 60 * 60 + 5 * 60) * 1000 - discord.utils.DISCORD_EPOCH) << 22
+
+    messages = list(messages)
+    recent = [message for message in messages if message.id > cutoff]
+
+    # units are lists of recent messages, or single old messages
+    units = [recent[i:i + 100] for i in range(0, len(recent), 100)]
+    units.extend([message] for message in messages if message.id <= cutoff)
+
+    async def delete(unit):
+        if len(unit) == 1:
+            await unit[0].delete()
+        else:
+            await channel.delete_messages(unit)
+
+    kwargs.setdefault("key", lambda unit: unit[0].id)
+    kwargs.setdefault("bucket", lambda unit: channel.id)
+
+    result = await run(units, delete, **kwargs)
+
+    # one result per message
+    return BulkResult([ItemResult(message, unit.ok, unit.value, unit.error, unit.attempts)
+                       for unit in result for message in unit.item])
@@ -0,0 +1,151 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import inspect
+import time
+
+
+def _name(func):
+    func = getattr(func, "func", func)  # functools.partial
+
+    return getattr(func, "__qualname__", None) or repr(func)
+
+
+class CheckPipeline(object):
+    """
+    Ordered list of checks. A check is a function or coroutine function that takes one argument (a message for the
+    bot's global checks, otherwise a command context) and returns a truthy value to pass. Anything else, including
+    None from a check that forgot to return, stops it. Checks may also raise :class:`detache.errors.CheckFailure` with a
+    message to send instead, which counts as a rejection.
+
+    Plain functions run first, in the order they were added, without awaiting anything. Coroutine functions only run
+    if all of the plain functions pass.
+
+    The number of calls, rejections and total time of each check are kept in :attr:`timings`.
+    """
+
+    def __init__(self, checks=()):
+        self._checks = []  # (name, func, is coroutine function)
+
+        self._sync = ()
+        self._async = ()
+
+        #: check name -> [calls, rejections, seconds]
+        self.timings = {}
+
+        for check in checks:
+            self.add(check)
+
+    def __len__(self):
+        return len(self._checks)
+
+    def add(self, func, name=None):
+        """
+        Adds a check to the end of the pipeline.
+
+        :param func: Function or coroutine function.
+        :param str name: (Optional) Name used in timings. Defaults to the function's name.
+        """
+
+        name = name or _name(func)
+
+        self._checks.append((name, func, inspect.iscoroutinefunction(func)))
+        self.timings.setdefault(name, [0, 0, 0.0])
+
+        self._compile()
+
+    def remove(self, func):
+        """Removes a check."""
+
+        self._checks = [check for check in self._checks if check[1] is not func]
+
+        self._compile()
+
+    def _compile(self):
+        self._sync = tuple((func, self.timings[name]) for name, func, is_async in self._checks if not is_async)
+        self._async = tuple((func, self.timings[name]) for name, func, is_async in self._checks if is_async)
+
+    @property
+    def has_async(self):
+        return len(self._async) > 0
+
+    def run_sync(self, obj):
+        """Runs the plain function checks. Returns False if one fails."""
+
+        for func, timing in self._sync:
+            start = time.perf_counter()
+
+            try:
+                passed = func(obj)
+            except Exception:
+                timing[1] += 1
+                raise
+            finally:
+                timing[0] += 1
+                timing[2] += time.perf_counter() - start
+
+            if not passed:
+                timing[1] += 1
+                return False
+
+        return True
+
+    async def run_async(self, obj):
+        """
+        Coroutine
+
+        Runs the coroutine function checks. Returns False if one fails.
+        """
+
+        for func, timing in self._async:
+            start = time.perf_counter()
+
+            try:
+                passed = await func(obj)
+            except Exception:
+                timing[1] += 1
+                raise
+            finally:
+                timing[0] += 1
+                timing[2] += time.perf_counter() - start
+
+            if not passed:
+                timing[1] += 1
+                return False
+
+        return True
+
+    async def run(self, obj):
+        """
+        Coroutine
+
+        Runs every check. Returns False if one fails.
+        """
+
+        return self.run_sync(obj) and (not self._async or await self.run_async(obj))
+
+    def metrics(self):
+        """Returns a dict of check name -> {"calls", "rejected", "seconds"}."""
+
+        return {
+            name: {"calls": calls, "rejected": rejected, "seconds": seconds}
+            for name, (calls, rejected, seconds) in self.timings.items()
+        }
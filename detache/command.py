@@ -18,12 +18,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
 import inspect
 import re
+import time
+from collections import OrderedDict, deque
 
 import discord
 
-from detache import errors
+from detache import errors, snapshot
+from detache.checks import CheckPipeline
+from detache.singleflight import SingleFlight
 
 
 class Context(object):
@@ -31,11 +36,13 @@ class Context(object):
     Command context, passed to command functions for easier handling
 
     :attr discord.Message message: Message
-    :attr discord.Guild guild: Guild the message was sent in
+    :attr discord.Guild guild: Guild the message was sent in, or None in DMs
     :attr discord.Channel channel: Channel the message was sent in
     :attr discord.Member: author: Author of the message
     """
 
+    __slots__ = ["plugin", "message", "guild", "channel", "author", "prefix"]
+
     def __init__(self, plugin, message, prefix=""):
         self.plugin = plugin
 
@@ -136,6 +143,12 @@ class User(Any):
 
     @classmethod
     def convert(cls, ctx, raw):
+        if ctx.guild is None:
+            return cls.convert_dm(ctx, raw)
+
+        if ctx.plugin.bot.member_cache is not None:  # member might not be cached, returns a coroutine
+            return cls.convert_uncached(ctx, raw)
+
         # if contains "#", user tag was passed. otherwise, mention
         if "#" in raw:
             member = ctx.guild.get_member_named(raw)
@@ -148,12 +161,48 @@ class User(Any):
 
         return member
 
+    @classmethod
+    async def convert_uncached(cls, ctx, raw):
+        member_cache = ctx.plugin.bot.member_cache
+
+        if "#" in raw:
+            member = await member_cache.get_member_named(ctx.guild, raw)
+        else:
+            member = await member_cache.get_member(ctx.guild, int(re.search("[0-9]+", raw)[0]))
+
+        if member is None:
+            raise errors.ParsingError("{} isn't a member of {}.".format(raw, ctx.guild))
+
+        return member
+
+    @classmethod
+    def convert_dm(cls, ctx, raw):
+        # in DMs, only users in the conversation can be passed by tag. mentions use the client's user cache
+        if "#" in raw:
+            name, _, discriminator = raw.rpartition("#")
+
+            for user in (ctx.author, ctx.channel.recipient, ctx.channel.me):
+                if user is not None and user.name == name and user.discriminator == discriminator:
+                    return user
+
+            raise errors.ParsingError("{} isn't in this conversation.".format(raw))
+
+        user = ctx.plugin.bot.get_user(int(re.search("[0-9]+", raw)[0]))
+
+        if user is None:
+            raise errors.ParsingError("I can't find {}.".format(raw))
+
+        return user
+
 
 class Channel(Any):
     pattern = r'(<#([0-9]+)>|#.{1,255})'
 
     @classmethod
     def convert(cls, ctx, raw):
+        if ctx.guild is None:
+            raise errors.ParsingError("Channels can only be used in a server.")
+
         # if starts with "#", name of channel was passed.
         if raw.startswith("#"):
             name = raw[1:]
@@ -175,6 +224,9 @@ class Role(Any):
 
     @classmethod
     def convert(cls, ctx, raw):
+        if ctx.guild is None:
+            raise errors.ParsingError("Roles can only be used in a server.")
+
         # if starts with "<@&", role mention was passed.
         if raw.startswith("<@&") and raw.endswith(">"):
             role_id = int(re.search("[0-9]+", raw)[0])
@@ -196,6 +248,57 @@ class Role(Any):
 
 # argument decorator
 
+class Argument(object):
+    """
+    Command argument, created by :func:`argument`.
+    """
+
+    __slots__ = ["name", "type_", "default", "required", "nargs", "help"]
+
+    def __init__(self, name, type_, default, required, nargs, help):
+        self.name = name
+        self.type_ = type_
+        self.default = default
+        self.required = required
+        self.nargs = nargs
+        self.help = help
+
+    def __repr__(self):
+        return "Argument({!r})".format(self.name)
+
+    def no_match_error(self):
+        if self.nargs == 1:
+            raise errors.ParsingError(
+                "**{}** is a required {}.".format(self.name, self.type_.__name__.lower())
+            )
+        else:
+            raise errors.ParsingError(
+                "**{}** are required.".format(self.name + ("" if self.name.endswith("s") else "s"))  # use plural
+            )
+
+    async def consume(self, ctx, args):
+        """
+        Coroutine
+
+        Parses an argument from an argument string, and returns the argument string with this argument consumed.
+
+        :return: parsed, argString
+        """
+
+        parsed, args = self.type_.consume(ctx, args)  # use argument type's parsing function
+
+        if inspect.isawaitable(parsed):  # converters that need to fetch, i.e. uncached members
+            parsed = await parsed
+
+        if parsed is NoMatch:  # argument is wrong type or not found
+            if self.required or self.nargs != 1:
+                self.no_match_error()
+            else:
+                parsed = self.default
+
+        return parsed, args
+
+
 def argument(name, type=None, default=None, required=True, nargs=1, help=None):
     """
     Command argument.
@@ -215,158 +318,485 @@ def argument(name, type=None, default=None, required=True, nargs=1, help=None):
 
     type = type or Any  # default ArgumentType class accepts anything as valid argument
 
-    class Argument:
-        @classmethod
-        def no_match_error(cls):
-            if nargs == 1:
-                raise errors.ParsingError(
-                    "**{}** is a required {}.".format(name, type.__name__.lower())
-                )
-            else:
-                raise errors.ParsingError(
-                    "**{}** are required.".format(name + ("" if name.endswith("s") else "s"))  # use plural
-                )
+    arg = Argument(name, type, default, required, nargs, help)
+
+    # actual decorator
+    def add_argument(func):
+        if hasattr(func, "cmd_args"):
+            func.cmd_args.append(arg)  # add to command function's arg list
+        else:
+            func.cmd_args = [arg]  # arg list doesnt exist, create it
 
-        @classmethod
-        def consume(cls, ctx, args):
-            """
-            Parses an argument from an argument string, and returns the argument string with this argument consumed.
+        return func
 
-            :return: parsed, argString
-            """
+    return add_argument
 
-            parsed, args = type.consume(ctx, args)  # use argument type's parsing function
 
-            if parsed is NoMatch:  # argument is wrong type or not found
-                if required or nargs != 1:
-                    cls.no_match_error()
-                else:
-                    parsed = default
+# reply caching
 
-            return parsed, args
+def _freeze(value):
+    # hashable version of a parsed argument
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
 
-    Argument.name = name
-    Argument.help = help
-    Argument.type_ = type
-    Argument.nargs = nargs
-    Argument.required = required
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
 
-    # actual decorator
-    def add_argument(func):
-        if hasattr(func, "cmd_args"):
-            func.cmd_args.append(Argument)  # add to command function's arg list
+    return value
+
+
+def _id(obj):
+    return getattr(obj, "id", obj)
+
+
+# functions that return the id of the guild, channel or user a command was used in
+scopes = {
+    None: lambda ctx: None,
+    "guild": lambda ctx: ctx.guild.id if ctx.guild is not None else None,
+    "channel": lambda ctx: ctx.channel.id,
+    "user": lambda ctx: ctx.author.id,
+}
+
+
+class CommandCache(object):
+    """
+    Caches command replies, so a command used again with the same arguments replies without running. Pass this to
+    :func:`command` with the cache keyword.
+
+    If the command is used again while a reply for the same arguments is still being made, it waits for that reply
+    instead of running again. The reply is still made if the first use is cancelled, as long as another is waiting.
+    Commands that return None (i.e. they sent their own messages) aren't cached, so they run every time.
+
+    :param float ttl: Seconds to keep a reply for.
+    :param int maxsize: Max number of replies to keep.
+    :param str scope: (Optional) "guild", "channel" or "user" to keep separate replies for each guild, channel or user.
+                      By default, replies are shared everywhere.
+    """
+
+    def __init__(self, ttl=60, maxsize=256, scope=None):
+        if scope not in scopes:
+            raise ValueError("scope must be one of {}".format(", ".join(repr(s) for s in scopes)))
+
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.scope = scope
+
+        self._scope_id = scopes[scope]
+
+        self._entries = OrderedDict()  # (scope id, args) -> (expires, reply), least recently used first
+        self._inflight = SingleFlight()  # replies being made right now
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, ctx, parsed_args):
+        """Returns the cache key for a use of the command."""
+
+        return self._scope_id(ctx), tuple(sorted((name, _freeze(value)) for name, value in parsed_args.items()))
+
+    async def get(self, key, func, *args, **kwargs):
+        """
+        Returns the cached reply for key. If there isn't one, awaits func(*args, **kwargs) and caches the result,
+        unless it's None.
+        """
+
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+                return entry[1]
+
+            del self._entries[key]
+
+        if key in self._inflight:  # same reply is already being made
+            self.hits += 1
         else:
-            func.cmd_args = [Argument]  # arg list doesnt exist, create it
+            self.misses += 1
 
-        return func
+        return await self._inflight.run(key, self._make, key, func, args, kwargs)
 
-    return add_argument
+    async def _make(self, key, func, args, kwargs):
+        # runs as its own task, shared by every use waiting for the reply
 
+        reply = await func(*args, **kwargs)
 
-# used to check plugin for commands
-class CommandInherit:
-    pass
+        if reply is None:  # nothing to reply with, the command has to run again to have its effect
+            return reply
+
+        self._entries[key] = (time.monotonic() + self.ttl, reply)
+
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return reply
+
+    def invalidate(self, scope=None, **arguments):
+        """
+        Removes cached replies. For example, in a guild scoped cache ::
+
+            self.leaderboard.cache.invalidate(message.guild, board="xp")
+
+        removes replies for the guild where the board argument was "xp".
+
+        :param scope: (Optional) Guild, channel or user (or its ID) to remove replies for. By default, replies are
+                      removed for all of them.
+        :param arguments: (Optional) Only remove replies where the arguments had these values.
+        """
+
+        scope_id = _id(scope)
+        arguments = {name: _freeze(value) for name, value in arguments.items()}
+
+        for key in list(self._entries):
+            key_scope, key_args = key
+
+            if scope is not None and key_scope != scope_id:
+                continue
 
+            if arguments:
+                key_args = dict(key_args)
 
-def command(name, description=None, required_permissions=None):
+                if any(key_args.get(name) != value for name, value in arguments.items()):
+                    continue
+
+            del self._entries[key]
+
+    def clear(self):
+        """Removes every cached reply."""
+
+        self._entries.clear()
+
+    def snapshot(self):
+        """
+        Returns the cached replies that can be pickled, with the seconds each has left. Used by :class:`detache.Bot`
+        snapshots.
+        """
+
+        now = time.monotonic()
+
+        return [(key, expires - now, reply) for key, (expires, reply) in self._entries.items()
+                if expires > now and snapshot.picklable((key, reply))]
+
+    def restore(self, entries, age=0):
+        """
+        Caches the replies from :meth:`snapshot`.
+
+        :param list entries: Result of :meth:`snapshot`.
+        :param float age: Seconds since the snapshot was taken.
+        """
+
+        now = time.monotonic()
+
+        for key, left, reply in entries:
+            if left > age:
+                self._entries[key] = (now + left - age, reply)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# concurrency limits
+
+class _Slot(object):
+    __slots__ = ["active", "waiters"]
+
+    def __init__(self):
+        self.active = 0
+        self.waiters = deque()
+
+
+class MaxConcurrency(object):
     """
-    Command decorator. Put this before a command and its arguments.
+    Limits how many uses of a command can run at once. Pass this to :func:`command` with the max_concurrency keyword.
 
-    :param str name: Name of command
-    :param str description: Description of commands
-    :param list[str] required_permissions: (Optional) Permissions required to use command
+    Limits are kept per guild, channel or user as they're used, and removed as soon as nothing is running or waiting,
+    so only active keys take up memory.
+
+    :param int limit: Max number of uses running at once, per key.
+    :param str per: (Optional) "guild", "channel" or "user" to limit each guild, channel or user separately. By
+                    default, the limit is global.
+    :param bool wait: (Optional) If True, uses over the limit wait for a turn. Otherwise, they're rejected.
+    :param int max_queue: (Optional) Max number of uses waiting per key. Uses past this are rejected.
     """
 
-    class Command(CommandInherit):
-        def __init__(self, func):
-            self.name = name
-            self.description = description or inspect.cleandoc(inspect.getdoc(func))
+    def __init__(self, limit, per=None, wait=True, max_queue=None):
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
 
-            self.args = list(reversed(getattr(func, "cmd_args", [])))  # fix order of arguments
+        if per not in scopes:
+            raise ValueError("per must be one of {}".format(", ".join(repr(s) for s in scopes)))
 
-            self.func = func
+        self.limit = limit
+        self.per = per
 
-            self.__doc__ = self.make_doc()
+        self.wait = wait
+        self.max_queue = max_queue
 
-        def __repr__(self):
-            return "Command({!r})".format(self.name)
+        self._scope_id = scopes[per]
 
-        def make_doc(self, prefix=""):
-            doc = "{}**{}** ".format(prefix, self.name) + " ".join([arg.name for arg in self.args]) + "\n\n"  # syntax
+        self._slots = {}  # key -> _Slot
 
-            # list arg types, names, descriptions
-            for arg in self.args:
-                arg_name = arg.type_.__name__ + ("(s)" if arg.nargs != 1 else "")
+        self.rejected = 0
+
+    def depth(self, key=None):
+        """Returns the number of uses waiting for a key, or in total if key is None."""
+
+        if key is not None:
+            slot = self._slots.get(key)
+            return 0 if slot is None else len(slot.waiters)
+
+        return sum(len(slot.waiters) for slot in self._slots.values())
+
+    def metrics(self):
+        """Returns a dict of the number of active keys, running uses, waiting uses and rejected uses."""
+
+        return {
+            "keys": len(self._slots),
+            "running": sum(slot.active for slot in self._slots.values()),
+            "queued": self.depth(),
+            "rejected": self.rejected,
+        }
+
+    async def acquire(self, ctx):
+        """
+        Coroutine
+
+        Waits for a turn to run the command.
+
+        :returns: Key to pass to :meth:`release`
+        :raises: :class:`detache.errors.MaxConcurrencyReached` if the use was rejected.
+        """
+
+        key = self._scope_id(ctx)
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+
+        if slot.active < self.limit and not slot.waiters:
+            slot.active += 1
+            return key
+
+        if not self.wait:
+            self.rejected += 1
+            raise errors.MaxConcurrencyReached("This command is busy right now. Try again in a bit.")
+
+        if self.max_queue is not None and len(slot.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise errors.MaxConcurrencyReached("Too many people are waiting to use this command. Try again in a bit.")
+
+        future = asyncio.get_event_loop().create_future()
+        slot.waiters.append(future)
+
+        try:
+            await future  # the turn is handed over by release
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # got the turn, but was cancelled before using it
+                self.release(key)
+            else:
+                slot.waiters.remove(future)
+                self._cleanup(key, slot)
+
+            raise
+
+        return key
+
+    def release(self, key):
+        """
+        Ends a use of the command, and hands its turn to the next waiting use.
+
+        :param key: Key returned by :meth:`acquire`
+        """
+
+        slot = self._slots[key]
+
+        while slot.waiters:
+            future = slot.waiters.popleft()
+
+            if not future.done():
+                future.set_result(None)
+                return
+
+        slot.active -= 1
+        self._cleanup(key, slot)
+
+    def _cleanup(self, key, slot):
+        if slot.active == 0 and not slot.waiters:
+            del self._slots[key]
+
+
+# used to check plugin for commands
+class CommandInherit:
+    __slots__ = []
+
+
+# created by the command decorator. no docstring, __doc__ is set per command
+class Command(CommandInherit):
+    __slots__ = ["name", "description", "required_permissions", "ordered", "cache", "checks", "dm_allowed",
+                 "max_concurrency", "args", "func", "plugin", "__doc__"]
+
+    def __init__(self, func, name, description=None, required_permissions=None, ordered=False, cache=None,
+                 checks=None, dm_allowed=False, max_concurrency=None):
+        self.name = name
+        self.description = description or inspect.cleandoc(inspect.getdoc(func))
+
+        self.required_permissions = required_permissions
+        self.ordered = ordered
+
+        if cache is not None and not isinstance(cache, CommandCache):  # ttl
+            cache = CommandCache(ttl=cache)
+
+        self.cache = cache
+
+        self.checks = CheckPipeline(checks) if checks else None
+
+        self.dm_allowed = dm_allowed
+
+        if max_concurrency is not None and not isinstance(max_concurrency, MaxConcurrency):  # global limit
+            max_concurrency = MaxConcurrency(max_concurrency)
+
+        self.max_concurrency = max_concurrency
+
+        self.args = list(reversed(getattr(func, "cmd_args", [])))  # fix order of arguments
+
+        self.func = func
+
+        self.plugin = None  # set when the plugin is created
 
-                doc += "• {} **{}**".format(arg_name, arg.name)
+        self.__doc__ = self.make_doc()
 
-                if arg.help is not None:
-                    doc += " - {}".format(arg.help)
+    def __repr__(self):
+        return "Command({!r})".format(self.name)
 
-                doc += "\n"
+    def make_doc(self, prefix=""):
+        doc = "{}**{}** ".format(prefix, self.name) + " ".join([arg.name for arg in self.args]) + "\n\n"  # syntax
 
-            doc += "\n" + self.description
+        # list arg types, names, descriptions
+        for arg in self.args:
+            arg_name = arg.type_.__name__ + ("(s)" if arg.nargs != 1 else "")
 
-            return doc
+            doc += "• {} **{}**".format(arg_name, arg.name)
 
-        async def process(self, ctx, content):
-            # process given arguments and run the command
+            if arg.help is not None:
+                doc += " - {}".format(arg.help)
 
-            # check for required permissions before parsing
-            if required_permissions is not None:
-                author_perms = ctx.author.permissions_in(ctx.channel)
+            doc += "\n"
 
-                for perm in required_permissions:
-                    # check permission. if not specified in permissions, assume False
-                    if not getattr(author_perms, perm, False):
-                        raise errors.MissingPermissions("This command requires the `{}` permission.".format(perm))
+        doc += "\n" + self.description
 
-            parsed_args = {}
+        return doc
 
-            try:
-                for arg in self.args:
-                    # parse argument and update with what's left of argument string
+    async def call(self, ctx, parsed_args):
+        # runs the command function, within its concurrency limit
 
-                    if arg.nargs == 1:  # only 1 arg
-                        parsed, content = arg.consume(ctx, content)
+        if self.max_concurrency is None:
+            return await self.func(ctx.plugin, ctx, **parsed_args)
 
-                        parsed_args[arg.name] = parsed
+        key = await self.max_concurrency.acquire(ctx)
 
-                    elif arg.nargs == -1:  # any number of args
-                        parsed = []
+        try:
+            return await self.func(ctx.plugin, ctx, **parsed_args)
+        finally:
+            self.max_concurrency.release(key)
+
+    async def process(self, ctx, content):
+        # process given arguments and run the command
+
+        # check for required permissions before parsing
+        if self.required_permissions is not None:
+            author_perms = ctx.author.permissions_in(ctx.channel)
+
+            for perm in self.required_permissions:
+                # check permission. if not specified in permissions, assume False
+                if not getattr(author_perms, perm, False):
+                    raise errors.MissingPermissions("This command requires the `{}` permission.".format(perm))
 
-                        while True:
-                            try:
-                                value, content = arg.consume(ctx, content)
+        # plugin and command checks
+        if ctx.plugin.checks and not await ctx.plugin.checks.run(ctx):
+            return
 
-                                parsed.append(value)
-                            except errors.ParsingError as e:  # no more args
-                                if len(parsed) == 0 and arg.required:
-                                    # must pass at least one arg if it's required
-                                    raise e
+        if self.checks is not None and not await self.checks.run(ctx):
+            return
 
-                                break
+        parsed_args = {}
+
+        try:
+            for arg in self.args:
+                # parse argument and update with what's left of argument string
 
-                        parsed_args[arg.name] = parsed
-                    else:
-                        parsed = []
+                if arg.nargs == 1:  # only 1 arg
+                    parsed, content = await arg.consume(ctx, content)
 
-                        for i in range(arg.nargs):  # limit to nargs
-                            try:
-                                value, content = arg.consume(ctx, content)
+                    parsed_args[arg.name] = parsed
+
+                elif arg.nargs == -1:  # any number of args
+                    parsed = []
+
+                    while True:
+                        try:
+                            value, content = await arg.consume(ctx, content)
+
+                            parsed.append(value)
+                        except errors.ParsingError as e:  # no more args
+                            if len(parsed) == 0 and arg.required:
+                                # must pass at least one arg if it's required
+                                raise e
+
+                            break
+
+                    parsed_args[arg.name] = parsed
+                else:
+                    parsed = []
 
-                                parsed.append(value)
-                            except errors.ParsingError:  # no more args
-                                break
+                    for i in range(arg.nargs):  # limit to nargs
+                        try:
+                            value, content = await arg.consume(ctx, content)
 
-                        parsed_args[arg.name] = parsed
+                            parsed.append(value)
+                        except errors.ParsingError:  # no more args
+                            break
 
-            except errors.ParsingError as e:
-                raise errors.ParsingError("{}\n\n{}".format(e, self.make_doc(ctx.prefix)))
+                    parsed_args[arg.name] = parsed
 
-            reply = await self.func(ctx.plugin, ctx, **parsed_args)
+        except errors.ParsingError as e:
+            raise errors.ParsingError("{}\n\n{}".format(e, self.make_doc(ctx.prefix)))
+
+        if self.cache is not None:
+            reply = await self.cache.get(self.cache.key(ctx, parsed_args), self.call, ctx, parsed_args)
+        else:
+            reply = await self.call(ctx, parsed_args)
+
+        if reply:
+            await ctx.send(reply)
+
+
+def command(name, description=None, required_permissions=None, ordered=False, cache=None, checks=None,
+            dm_allowed=False, max_concurrency=None):
+    """
+    Command decorator. Put this before a command and its arguments.
+
+    :param str name: Name of command
+    :param str description: Description of commands
+    :param list[str] required_permissions: (Optional) Permissions required to use command
+    :param bool ordered: (Optional) If True, uses of the command run one at a time per guild, in the order they were
+                         sent. See :class:`detache.plugin.GuildLanes`.
+    :param cache: (Optional) :class:`CommandCache` to cache the command's replies in, or a number of seconds to cache
+                  replies for. The cache can be reached through the command, i.e. ``self.stats.cache``
+    :param list checks: (Optional) Functions or coroutine functions that take the command context, and return a
+                        truthy value to let the command run. See :class:`detache.checks.CheckPipeline`
+    :param bool dm_allowed: (Optional) If True, the command can be used in direct messages. ctx.guild is None there.
+    :param max_concurrency: (Optional) :class:`MaxConcurrency`, or the max number of uses that can run at once.
+    """
 
-            if reply:
-                await ctx.send(reply)
+    def decorator(func):
+        return Command(func, name, description, required_permissions, ordered, cache, checks, dm_allowed,
+                       max_concurrency)
 
-    return Command
+    return decorator
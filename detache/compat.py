@@ -0,0 +1,72 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import inspect
+
+import discord
+
+from detache import errors
+
+# everything detache needs from discord.py that isn't public API. only this module touches discord.py's private
+# attributes, so a discord.py upgrade only has to be checked here
+
+
+def check_member_cache():
+    """
+    Raises :class:`detache.errors.DetacheException` if the installed discord.py doesn't have what
+    :class:`detache.members.MemberCache` needs.
+    """
+
+    guild = discord.Guild
+
+    missing = [name for name in ("_add_member", "_remove_member", "_members", "_voice_states", "fetch_member")
+               if not hasattr(guild, name) and name not in getattr(guild, "__slots__", ())]
+
+    if not hasattr(guild, "query_members") or "cache" not in inspect.signature(guild.query_members).parameters:
+        missing.append("query_members(cache=)")
+
+    if missing:
+        raise errors.DetacheException("The member cache needs discord.py 1.7.3 or later, which has {}. Found {}."
+                                      .format(", ".join(missing), discord.__version__))
+
+
+def add_member(guild, member):
+    """Puts a member in the guild's member cache."""
+
+    guild._add_member(member)
+
+
+def remove_member(guild, member):
+    """Removes a member from the guild's member cache."""
+
+    guild._remove_member(member)
+
+
+def cached_member_ids(guild):
+    """Returns a set-like view of the IDs of the guild's cached members."""
+
+    return guild._members.keys()
+
+
+def in_voice(guild, member_id):
+    """Returns whether a member is in one of the guild's voice channels."""
+
+    return member_id in guild._voice_states
@@ -0,0 +1,425 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import bisect
+import itertools
+import json
+import logging
+import time
+
+from detache.resources import SQLiteConnection
+
+default_log = logging.getLogger("outlet")
+
+
+class _SortedList(object):
+    # sorted list split into buckets of up to 2 * load items, so inserts and removes move at most one bucket's items
+    # instead of the whole list
+
+    load = 512
+
+    def __init__(self, items=()):
+        items = sorted(items)
+
+        self._buckets = [items[i:i + self.load] for i in range(0, len(items), self.load)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def add(self, item):
+        if not self._buckets:
+            self._buckets.append([item])
+            self._maxes.append(item)
+            return
+
+        i = bisect.bisect_left(self._maxes, item)
+        if i == len(self._buckets):  # bigger than everything
+            i -= 1
+
+        bucket = self._buckets[i]
+        bisect.insort(bucket, item)
+        self._maxes[i] = bucket[-1]
+
+        if len(bucket) > 2 * self.load:  # split in half
+            self._buckets.insert(i + 1, bucket[self.load:])
+            del bucket[self.load:]
+
+            self._maxes.insert(i, bucket[-1])
+
+    def remove(self, item):
+        i = bisect.bisect_left(self._maxes, item)
+
+        bucket = self._buckets[i]
+        del bucket[bisect.bisect_left(bucket, item)]
+
+        if bucket:
+            self._maxes[i] = bucket[-1]
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+
+    def index(self, item):
+        # number of items less than item
+
+        i = bisect.bisect_left(self._maxes, item)
+        if i == len(self._buckets):
+            return len(self)
+
+        return sum(len(bucket) for bucket in self._buckets[:i]) + bisect.bisect_left(self._buckets[i], item)
+
+    def slice(self, start, stop):
+        items = []
+
+        for bucket in self._buckets:
+            if start >= len(bucket):  # skip whole buckets
+                start -= len(bucket)
+                stop -= len(bucket)
+                continue
+
+            items.extend(bucket[start:stop])
+
+            stop -= len(bucket)
+            start = 0
+
+            if stop <= 0:
+                break
+
+        return items
+
+
+class Leaderboard(object):
+    """
+    Counters by key, i.e. XP by user ID, kept sorted so the top entries and any key's rank are quick to find. Created
+    by :meth:`CounterStore.leaderboard`.
+
+    Keys with the same value share a rank: the rank is 1 + the number of keys with a higher value, so two keys tied
+    for first are both rank 1, and the next key is rank 3. In :meth:`top`, tied keys are listed in the order they
+    reached the value. Keys are never compared with each other, so they can be any hashable type.
+
+    Changing a value takes O(log n) time, plus moving at most a thousand entries in memory. Finding a rank also adds up
+    the sizes of the n / 512 buckets the entries are kept in.
+    """
+
+    def __init__(self, name, store=None):
+        self.name = name
+
+        self._store = store
+
+        self._values = {}  # key -> value
+        self._entries = {}  # key -> (-value, sequence, key), its entry in _sorted
+        self._sorted = _SortedList()  # highest value first, then first to reach it
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __getitem__(self, key):
+        return self._values.get(key, 0)
+
+    def _load(self, values):
+        self._values = dict(values)
+        self._entries = {key: (-value, next(self._sequence), key) for key, value in self._values.items()}
+        self._sorted = _SortedList(self._entries.values())
+
+    def set(self, key, value):
+        """Sets a key's value."""
+
+        old = self._entries.get(key)
+
+        if old is not None:
+            if -old[0] == value:  # keeps its place among ties
+                return value
+
+            self._sorted.remove(old)
+
+        entry = self._entries[key] = (-value, next(self._sequence), key)
+        self._values[key] = value
+        self._sorted.add(entry)
+
+        if self._store is not None:
+            self._store._dirty.add((self.name, key))
+
+        return value
+
+    def incr(self, key, amount=1):
+        """
+        Adds to a key's value.
+
+        :returns: The new value.
+        """
+
+        return self.set(key, self._values.get(key, 0) + amount)
+
+    def top(self, count=10, offset=0):
+        """
+        Returns a list of (key, value) with the highest values, highest first. Ties are in the order the keys reached
+        the value.
+
+        :param int count: (Optional) Number of entries. Defaults to 10.
+        :param int offset: (Optional) Entries to skip, for pages after the first.
+        """
+
+        return [(key, -value) for value, sequence, key in self._sorted.slice(offset, offset + count)]
+
+    def rank(self, key):
+        """
+        Returns a key's rank, starting at 1, or None if it has no value. Tied keys have the same rank.
+        """
+
+        value = self._values.get(key)
+
+        if value is None:
+            return None
+
+        return self._sorted.index((-value,)) + 1  # (-value,) sorts before every entry with that value
+
+
+class CounterBackend(object):
+    """
+    Base class of where a :class:`CounterStore` saves its counters. Subclass this to save them somewhere else.
+    """
+
+    async def open(self):
+        pass
+
+    async def load(self):
+        """
+        Coroutine
+
+        Returns every saved counter, as a dict of leaderboard name -> {key: value}.
+        """
+
+        return {}
+
+    async def write(self, rows):
+        """
+        Coroutine
+
+        Saves changed counters in one batch.
+
+        :param list rows: List of (leaderboard name, key, value).
+        """
+
+        pass
+
+    async def close(self):
+        pass
+
+
+def _encode(key):
+    return json.dumps(key)
+
+
+def _decode(key):
+    key = json.loads(key)
+
+    return tuple(key) if isinstance(key, list) else key  # json turns tuple keys into lists
+
+
+class SQLiteBackend(CounterBackend):
+    """
+    Saves counters in an sqlite database, one batched upsert per flush.
+
+    :param str path: Database file.
+    :param str table: (Optional) Table name. Defaults to "counters".
+    """
+
+    def __init__(self, path, table="counters"):
+        self.connection = SQLiteConnection(path)
+        self.table = table
+
+    async def open(self):
+        await self.connection.connect()
+
+        await self.connection.execute("CREATE TABLE IF NOT EXISTS {} (name TEXT, key TEXT, value INTEGER, "
+                                      "PRIMARY KEY (name, key))".format(self.table))
+        await self.connection.commit()
+
+    async def load(self):
+        counters = {}
+
+        for name, key, value in await self.connection.execute("SELECT name, key, value FROM {}".format(self.table)):
+            counters.setdefault(name, {})[_decode(key)] = value
+
+        return counters
+
+    async def write(self, rows):
+        try:
+            await self.connection.executemany(
+                "INSERT INTO {} (name, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, key) DO UPDATE SET value = excluded.value".format(self.table),
+                [(name, _encode(key), value) for name, key, value in rows])
+
+            await self.connection.commit()
+        except BaseException:
+            await self.connection.rollback()
+            raise
+
+    async def close(self):
+        await self.connection.close()
+
+
+class CounterStore(object):
+    """
+    Write-behind store of counters and leaderboards. Changes are made in memory, and changed counters are saved to
+    the backend in one batch every interval seconds, instead of a database write for every message. ::
+
+        xp = self.bot.counters.leaderboard("xp")
+
+        xp.incr(message.author.id, 10)
+        top = xp.top(10)
+
+    Use :meth:`Bot.enable_counters`, which loads the store when the bot starts and flushes it when the bot closes.
+
+    :param backend: (Optional) :class:`CounterBackend` to save counters in. By default they're only kept in memory.
+    :param float interval: (Keyword) Seconds between flushes.
+    :param logger: (Keyword) Logging object.
+    """
+
+    def __init__(self, backend=None, *, interval=10, logger=default_log):
+        self.backend = backend or CounterBackend()
+        self.interval = interval
+
+        self.log = logger
+
+        self._leaderboards = {}
+        self._dirty = set()  # (leaderboard name, key) changed since the last flush
+
+        self._task = None
+        self._flushing = asyncio.Lock()
+
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush = 0.0
+        self.max_flush = 0.0
+        self.flush_time = 0.0
+
+    def leaderboard(self, name):
+        """
+        Returns the :class:`Leaderboard` with a name, creating it if there isn't one.
+        """
+
+        leaderboard = self._leaderboards.get(name)
+
+        if leaderboard is None:
+            leaderboard = self._leaderboards[name] = Leaderboard(name, self)
+
+        return leaderboard
+
+    def incr(self, name, key, amount=1):
+        """Adds to a key's value in a leaderboard. Shortcut for ``leaderboard(name).incr(key, amount)``"""
+
+        return self.leaderboard(name).incr(key, amount)
+
+    async def start(self):
+        """
+        Coroutine
+
+        Opens the backend, loads saved counters, and starts flushing.
+        """
+
+        await self.backend.open()
+
+        for name, values in (await self.backend.load()).items():
+            self.leaderboard(name)._load(values)
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush_every())
+
+    async def _flush_every(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await self.flush()
+            except Exception:
+                self.log.exception("error flushing counters, retrying next flush")
+
+    async def flush(self):
+        """
+        Coroutine
+
+        Saves every counter changed since the last flush.
+        """
+
+        async with self._flushing:
+            if not self._dirty:
+                return
+
+            dirty, self._dirty = self._dirty, set()
+
+            rows = [(name, key, self._leaderboards[name][key]) for name, key in dirty]
+
+            start = time.perf_counter()
+
+            try:
+                await self.backend.write(rows)
+            except BaseException:
+                self._dirty |= dirty  # written next flush
+                raise
+
+            elapsed = time.perf_counter() - start
+
+            self.flushes += 1
+            self.rows_written += len(rows)
+
+            self.last_flush = elapsed
+            self.flush_time += elapsed
+            if elapsed > self.max_flush:
+                self.max_flush = elapsed
+
+            self.log.debug("flushed %d counters in %.3fs", len(rows), elapsed)
+
+    async def close(self):
+        """
+        Coroutine
+
+        Stops flushing, saves every changed counter, and closes the backend.
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        try:
+            await self.flush()
+        finally:
+            await self.backend.close()
+
+    def metrics(self):
+        """
+        Returns a dict of counters waiting to be flushed, flushes and rows written, and the last, highest and mean
+        flush time in seconds.
+        """
+
+        return {
+            "pending": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "last_flush": self.last_flush,
+            "max_flush": self.max_flush,
+            "mean_flush": self.flush_time / self.flushes if self.flushes else None,
+        }
@@ -0,0 +1,423 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+default_log = logging.getLogger("outlet")
+
+
+# cpu timing
+
+class _Timed(object):
+    # drives a coroutine, adding the cpu time of each step to a timing entry
+
+    __slots__ = ["coroutine", "timing"]
+
+    def __init__(self, coroutine, timing):
+        self.coroutine = coroutine
+        self.timing = timing
+
+    def __await__(self):
+        coroutine = self.coroutine
+        timing = self.timing
+
+        timing[0] += 1
+
+        value = None
+        exc = None
+
+        while True:
+            start = time.thread_time()
+
+            try:
+                if exc is None:
+                    signal = coroutine.send(value)
+                else:
+                    signal = coroutine.throw(exc)
+            except StopIteration as e:
+                timing[1] += time.thread_time() - start
+                return e.value
+            except BaseException:
+                timing[1] += time.thread_time() - start
+                raise
+
+            timing[1] += time.thread_time() - start
+
+            try:
+                value = yield signal
+                exc = None
+            except BaseException as e:  # thrown in by the task, i.e. cancellation
+                value = None
+                exc = e
+
+
+async def timed(coroutine, timings, key):
+    """
+    Runs a coroutine, adding up the cpu time it uses.
+
+    :param coroutine: Coroutine to run.
+    :param dict timings: Dict of key -> [calls, cpu seconds] to add the timing to.
+    :param key: Key in timings.
+    :return: Return value of coroutine
+    """
+
+    timing = timings.get(key)
+    if timing is None:
+        timing = timings[key] = [0, 0.0]
+
+    return await _Timed(coroutine, timing)
+
+
+def cpu_times(plugins):
+    """
+    Returns the cpu time used by each plugin, if the watchdog is running. For example ::
+
+        {"Math": {"total": 0.52, "command:add": 0.5, "event_listener:on_message": 0.02}}
+
+    :param plugins: Plugins.
+    """
+
+    report = {}
+
+    for plugin in plugins:
+        times = {"{}:{}".format(kind, name): cpu for (kind, name), (calls, cpu) in plugin.timings.items()}
+        times["total"] = sum(times.values())
+
+        report[plugin.__plugin_name__] = times
+
+    return report
+
+
+# lag attribution
+
+def code_owners(plugins):
+    """
+    Returns a dict of code object -> (plugin name, kind, name) for the commands, event listeners, background tasks and
+    other methods of plugins.
+
+    :param plugins: Plugins.
+    """
+
+    owners = {}
+
+    for plugin in plugins:
+        plugin_name = plugin.__plugin_name__
+
+        # plain methods first, so they're replaced by the more specific entries below
+        for cls in type(plugin).__mro__:
+            if cls.__module__.startswith("detache."):  # framework classes
+                continue
+
+            for name, o in vars(cls).items():
+                if inspect.isfunction(o):
+                    owners.setdefault(o.__code__, (plugin_name, "method", name))
+
+        for o in plugin.commands.values():
+            owners[o.func.__code__] = (plugin_name, "command", o.name)
+
+        for listeners in plugin.event_listeners.values():
+            for o in listeners:
+                owners[o.func.__code__] = (plugin_name, "event_listener", o.func.__name__)
+
+        for o in plugin.bg_tasks.values():
+            owners[o.func.__code__] = (plugin_name, "background_task", o.id)
+
+    return owners
+
+
+def frame_owners(frame, owners):
+    """
+    Returns the owners of each frame in a stack that belongs to a plugin, outermost first.
+
+    :param frame: Innermost frame.
+    :param dict owners: Dict from :func:`code_owners`.
+    """
+
+    found = []
+
+    while frame is not None:
+        owner = owners.get(frame.f_code)
+        if owner is not None:
+            found.append(owner)
+
+        frame = frame.f_back
+
+    found.reverse()
+
+    return found
+
+
+def rss():
+    """
+    Returns the resident memory of the process in bytes, or the peak resident memory where the current isn't available.
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:  # windows
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+class LagReport(object):
+    """
+    Report of the event loop being blocked, made by :class:`Watchdog`.
+
+    :attr float time: time.time() when the lag was noticed
+    :attr float lag: Seconds the loop was blocked for. Updated when the loop recovers.
+    :attr list stack: Formatted stack of the code blocking the loop
+    :attr owner: (plugin name, kind, name) of the command, event listener or background task blocking the loop, or None
+    :attr list owners: Every plugin frame in the stack, outermost first
+    """
+
+    __slots__ = ["time", "lag", "stack", "owner", "owners"]
+
+    def __init__(self, lag, stack, owners):
+        self.time = time.time()
+        self.lag = lag
+
+        self.stack = stack
+
+        self.owners = owners
+        self.owner = owners[0] if owners else None
+
+    def __repr__(self):
+        return "LagReport(lag={:.3f}, owner={!r})".format(self.lag, self.owner)
+
+
+class Watchdog(object):
+    """
+    Measures event loop lag from a background thread. If the loop doesn't respond for threshold seconds, the stack of
+    the code blocking it is captured and attributed to the plugin running it. While the watchdog is running, plugins
+    also keep track of the cpu time used by their commands, event listeners and background tasks.
+
+    Use :meth:`Bot.enable_watchdog` instead of creating this directly.
+
+    :param bot: Bot to watch.
+    :param float interval: (Keyword) Seconds between checks.
+    :param float threshold: (Keyword) Seconds of lag before a report is made.
+    :param on_lag: (Keyword) (Optional) Function called with a :class:`LagReport` on the event loop, after it recovers.
+    :param int keep: (Keyword) Number of recent reports to keep.
+    :param logger: (Keyword) Logging object used to log reports.
+    """
+
+    def __init__(self, bot, *, interval=0.1, threshold=0.5, on_lag=None, keep=20, logger=default_log):
+        self.bot = bot
+
+        self.interval = interval
+        self.threshold = threshold
+
+        self.on_lag = on_lag
+
+        self.log = logger
+
+        #: recent :class:`LagReport` objects
+        self.reports = deque(maxlen=keep)
+
+        #: highest lag seen, in seconds
+        self.max_lag = 0.0
+
+        self._loop = None
+        self._loop_thread = None  # ident of the thread running the loop
+
+        self._beat = None  # time.monotonic() of last heartbeat
+        self._expected = None  # when the next heartbeat should run
+        self._stall = None  # report for the current stall
+
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self._owners = {}
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Starts the watchdog. Must be called from the event loop."""
+
+        if self.running:
+            return
+
+        self._loop = self.bot.loop
+        self._loop_thread = threading.get_ident()
+
+        self._owners = code_owners(self.bot.plugins)
+
+        self._beat = time.monotonic()
+        self._expected = self._beat + self.interval
+        self._loop.call_later(self.interval, self._heartbeat)
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="detache-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the watchdog."""
+
+        self._stopped.set()
+        self._thread = None
+
+    def _heartbeat(self):
+        if self._stopped.is_set():
+            return
+
+        now = time.monotonic()
+        lag = now - self._expected
+
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+        stall = self._stall
+        if stall is not None:  # the loop has recovered
+            self._stall = None
+            stall.lag = lag
+
+            self.log.warning("event loop was blocked for %.3fs by %r", lag, stall.owner)
+
+            if self.on_lag is not None:
+                self.on_lag(stall)
+
+        self._beat = now
+        self._expected = now + self.interval
+        self._loop.call_later(self.interval, self._heartbeat)
+
+    def _watch(self):
+        # runs in the watchdog thread
+
+        while not self._stopped.wait(self.interval):
+            lag = time.monotonic() - self._beat - self.interval
+
+            if lag < self.threshold or self._stall is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+
+            report = LagReport(lag, traceback.format_stack(frame), frame_owners(frame, self._owners))
+            del frame
+
+            self._stall = report
+            self.reports.append(report)
+
+            self.log.warning("event loop blocked for %.3fs by %r:\n%s", lag, report.owner, "".join(report.stack))
+
+
+# sampling profiler
+
+class Profiler(object):
+    """
+    Statistical profiler for a running bot. Samples the stack of the event loop's thread from a background thread, and
+    returns the samples as collapsed stacks, which flame graph tools like flamegraph.pl and speedscope can read.
+
+    Frames that belong to plugins are named after the plugin and the command, event listener or background task, i.e.
+    ``Math.command:add``.
+
+    :param bot: Bot to profile.
+    :param float interval: (Keyword) Seconds between samples.
+    """
+
+    def __init__(self, bot, *, interval=0.005):
+        self.bot = bot
+        self.interval = interval
+
+    async def run(self, duration):
+        """
+        Coroutine
+
+        Profiles the bot for duration seconds.
+
+        :param float duration: Seconds to profile for.
+        :returns: str of collapsed stacks, one "frame;frame;frame count" line per unique stack
+        """
+
+        loop_thread = threading.get_ident()
+        owners = code_owners(self.bot.plugins)
+
+        # the sampling thread can only look at the loop's stack when it gets the GIL. with the default 5ms switch
+        # interval, the loop thread usually hands it over when it's idle, so busy code would be under-counted
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 10))
+
+        try:
+            samples = await asyncio.get_event_loop().run_in_executor(None, self._sample, loop_thread, owners, duration)
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        return "\n".join("{} {}".format(stack, count) for stack, count in samples.most_common())
+
+    def _sample(self, loop_thread, owners, duration):
+        # runs in an executor thread
+
+        samples = Counter()
+        labels = {}  # code object -> frame label
+
+        end = time.monotonic() + duration
+
+        while time.monotonic() < end:
+            frame = sys._current_frames().get(loop_thread)
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = self._label(code, owners.get(code))
+
+                stack.append(label)
+                frame = frame.f_back
+
+            stack.reverse()
+            samples[";".join(stack)] += 1
+
+            time.sleep(self.interval)
+
+        return samples
+
+    @staticmethod
+    def _label(code, owner):
+        if owner is not None:
+            plugin_name, kind, name = owner
+            label = "{}.{}:{}".format(plugin_name, kind, name)
+        else:
+            label = "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+        # ";" separates frames and " " separates the count
+        return label.replace(";", ",").replace(" ", "_")
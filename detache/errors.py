@@ -23,6 +23,13 @@ class DetacheException(Exception):
     pass
 
 
+class HTTPError(DetacheException):
+    def __init__(self, status, message):
+        super().__init__("{} {}".format(status, message))
+
+        self.status = status
+
+
 class CommandError(Exception):
     pass
 
@@ -41,3 +48,11 @@ class WrongType(ParsingError):
 
 class MissingPermissions(CommandError):
     pass
+
+
+class CheckFailure(CommandError):
+    pass
+
+
+class MaxConcurrencyReached(CommandError):
+    pass
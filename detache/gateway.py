@@ -0,0 +1,76 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import time
+
+from detache.util import JSONFile
+
+
+class SessionStore(object):
+    """
+    Saves gateway sessions to a JSON file, so a restarted bot can resume its session instead of identifying again.
+    Used by :class:`detache.Bot` when it's given a session_file.
+
+    Discord only keeps a session for a short time after the connection closes, so sessions older than max_age aren't
+    resumed.
+
+    :param str path: Path to the file.
+    :param float max_age: (Optional) Seconds a saved session is resumable for. Defaults to 120.
+    """
+
+    def __init__(self, path, max_age=120):
+        self.path = path
+        self.max_age = max_age
+
+        self._file = JSONFile(path)
+
+    def save(self, shard_id, session_id, sequence):
+        """
+        Saves a shard's session.
+
+        :param shard_id: Shard ID, or None if the bot isn't sharded.
+        :param str session_id: Session ID from the gateway.
+        :param int sequence: Sequence number of the last event received.
+        """
+
+        sessions = self._file.read({})
+        sessions[str(shard_id)] = {"session_id": session_id, "sequence": sequence, "saved": time.time()}
+
+        self._file.write(sessions)
+
+    def pop(self, shard_id):
+        """
+        Removes a shard's session and returns (session_id, sequence), or None if there isn't a resumable one. Sessions
+        are removed as they're used, so a session is only ever resumed once.
+        """
+
+        sessions = self._file.read({})
+        session = sessions.pop(str(shard_id), None)
+
+        if session is None:
+            return None
+
+        self._file.write(sessions)
+
+        if time.time() - session["saved"] > self.max_age:
+            return None
+
+        return session["session_id"], session["sequence"]
@@ -0,0 +1,413 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+import aiohttp
+from multidict import CIMultiDict
+
+from detache import errors
+from detache.singleflight import SingleFlight
+
+# statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# methods that are safe to retry
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class Response(object):
+    """
+    HTTP response returned by :class:`HTTPClient`. The body is read before the response is returned, so it can be
+    cached and shared between callers.
+
+    :attr int status: Status code
+    :attr headers: Response headers
+    :attr bytes body: Response body
+    :attr bool from_cache: True if the response came from the cache without a request
+    """
+
+    __slots__ = ["method", "url", "status", "headers", "body", "from_cache"]
+
+    def __init__(self, method, url, status, headers, body, from_cache=False):
+        self.method = method
+        self.url = url
+
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+        self.from_cache = from_cache
+
+    def __repr__(self):
+        return "Response({} {} {})".format(self.method, self.url, self.status)
+
+    async def read(self):
+        return self.body
+
+    async def text(self, encoding="utf-8"):
+        return self.body.decode(encoding)
+
+    async def json(self, loads=json.loads):
+        return loads(self.body.decode("utf-8"))
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise errors.HTTPError(self.status, self.url)
+
+
+# returned by HTTPClient.request, so requests can be awaited or used with "async with" like aiohttp
+class _RequestContext(object):
+    __slots__ = ["_coro"]
+
+    def __init__(self, coro):
+        self._coro = coro
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        return await self._coro
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class _CacheEntry(object):
+    __slots__ = ["status", "headers", "body", "expires"]
+
+    def __init__(self, status, headers, body, expires):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+        self.expires = expires  # time.time() the entry must be revalidated after
+
+    def __getstate__(self):
+        return self.status, list(self.headers.items()), self.body, self.expires
+
+    def __setstate__(self, state):
+        self.status, headers, self.body, self.expires = state
+        self.headers = CIMultiDict(headers)
+
+
+def _parse_cache_control(headers):
+    directives = {}
+
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+
+        if name:
+            directives[name.lower()] = value.strip('"')
+
+    return directives
+
+
+class ResponseCache(object):
+    """
+    Cache for GET responses, used by :class:`HTTPClient`. Responses are kept in memory, and optionally in a directory
+    on disk so they survive restarts.
+
+    Responses are fresh for their Cache-Control max-age. After that (or if there's no max-age), responses with an ETag
+    or Last-Modified header are revalidated with a conditional request. Responses marked no-store are never cached.
+
+    :param int maxsize: Max number of responses kept in memory.
+    :param str path: (Optional) Directory to store responses in.
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        self.path = path
+
+        self._entries = OrderedDict()  # key -> _CacheEntry, least recently used first
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def _read_file(self, key):
+        try:
+            with open(self._file(key), "rb") as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_file(self, key, entry):
+        with open(self._file(key), "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.path is not None:
+            entry = await asyncio.get_event_loop().run_in_executor(None, self._read_file, key)
+
+            if entry is not None:
+                self._remember(key, entry)
+
+        return entry
+
+    async def put(self, key, entry):
+        self._remember(key, entry)
+
+        if self.path is not None:
+            await asyncio.get_event_loop().run_in_executor(None, self._write_file, key, entry)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def make_entry(self, status, headers, body):
+        """Returns a cache entry for a response, or None if it can't be cached."""
+
+        cache_control = _parse_cache_control(headers)
+
+        if status != 200 or "no-store" in cache_control:
+            return None
+
+        max_age = 0
+        if "no-cache" not in cache_control:
+            try:
+                max_age = int(cache_control.get("max-age", 0))
+            except ValueError:
+                pass
+
+        if max_age <= 0 and "ETag" not in headers and "Last-Modified" not in headers:
+            return None  # would never be fresh, and can't be revalidated
+
+        return _CacheEntry(status, CIMultiDict(headers), body, time.time() + max_age)
+
+
+class HTTPClient(object):
+    """
+    HTTP client used by plugins through :attr:`Plugin.http`. Wraps an aiohttp session with connection limits, timeouts
+    and DNS caching, and adds response caching, coalescing of identical in-flight GET requests, and retries with
+    exponential backoff.
+
+    The aiohttp session is created by the first request, and closed with the bot.
+
+    Requests can be awaited, or used like aiohttp requests: ::
+
+        async with self.http.get(url) as response:
+            data = await response.json()
+
+    :param int limit: (Keyword) Max number of open connections.
+    :param int limit_per_host: (Keyword) Max number of open connections to one host. 0 means no limit.
+    :param float timeout: (Keyword) Total timeout for a request in seconds, including every retry and the waits between
+                          them. None means no timeout. A retry that can't finish in time isn't made, and the last
+                          response or error is returned instead.
+    :param int dns_cache: (Keyword) Seconds to cache DNS lookups for.
+    :param int retries: (Keyword) Number of times to retry an idempotent request after a connection error, timeout, or
+                        429/5xx response.
+    :param float backoff: (Keyword) Delay before the first retry. Doubled after every retry.
+    :param float max_retry_after: (Keyword) Longest Retry-After to wait for. If a 429/5xx response asks to wait longer,
+                                  it's returned instead of being retried.
+    :param cache: (Keyword) (Optional) :class:`ResponseCache` for GET responses.
+    :param dict headers: (Keyword) (Optional) Headers sent with every request.
+    """
+
+    def __init__(self, *, limit=100, limit_per_host=0, timeout=30, dns_cache=300, retries=3, backoff=0.5,
+                 max_retry_after=60, cache=None, headers=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.dns_cache = dns_cache
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+
+        self.cache = cache
+        self.headers = headers
+
+        self._session = None
+        self._inflight = SingleFlight()  # GETs being made right now
+
+    @property
+    def session(self):
+        """aiohttp.ClientSession used for requests. Created when first used."""
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_cache)
+
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        return self._session
+
+    @property
+    def closed(self):
+        return self._session is None or self._session.closed
+
+    async def close(self):
+        """Closes the aiohttp session."""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def request(self, method, url, **kwargs):
+        """
+        Makes a request. Takes the same keywords as aiohttp.ClientSession.request.
+
+        :returns: :class:`Response`
+        """
+
+        return _RequestContext(self._request(method.upper(), url, kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    @staticmethod
+    def _key(url, kwargs):
+        params = kwargs.get("params")
+        headers = kwargs.get("headers")
+
+        key = str(url)
+
+        if params:
+            key += "?" + repr(sorted(params.items()) if isinstance(params, dict) else params)
+
+        if headers:
+            key += " " + repr(sorted(headers.items()))
+
+        return key
+
+    async def _request(self, method, url, kwargs):
+        if method != "GET" or "data" in kwargs or "json" in kwargs:
+            return await self._send(method, url, kwargs)
+
+        key = self._key(url, kwargs)
+
+        # identical GETs made at the same time share one request
+        return await self._inflight.run(key, self._get, key, url, kwargs)
+
+    async def _get(self, key, url, kwargs):
+        if self.cache is None:
+            return await self._send("GET", url, kwargs)
+
+        entry = await self.cache.get(key)
+
+        if entry is not None:
+            if entry.expires > time.time():
+                self.cache.hits += 1
+                return Response("GET", url, entry.status, entry.headers, entry.body, from_cache=True)
+
+            # stale, revalidate
+            headers = dict(kwargs.get("headers") or {})
+
+            if "ETag" in entry.headers:
+                headers["If-None-Match"] = entry.headers["ETag"]
+            if "Last-Modified" in entry.headers:
+                headers["If-Modified-Since"] = entry.headers["Last-Modified"]
+
+            kwargs = dict(kwargs, headers=headers)
+
+        self.cache.misses += 1
+
+        response = await self._send("GET", url, kwargs)
+
+        if response.status == 304 and entry is not None:  # not modified, refresh the cached response
+            headers = CIMultiDict(entry.headers)
+            headers.update(response.headers)
+
+            new_entry = self.cache.make_entry(entry.status, headers, entry.body)
+            if new_entry is not None:
+                await self.cache.put(key, new_entry)
+
+            return Response("GET", url, entry.status, headers, entry.body)
+
+        new_entry = self.cache.make_entry(response.status, response.headers, response.body)
+        if new_entry is not None:
+            await self.cache.put(key, new_entry)
+
+        return response
+
+    async def _send(self, method, url, kwargs):
+        if self.timeout is None:
+            return await self._attempts(method, url, kwargs, None)
+
+        # the session's timeout only covers one attempt, this one covers every attempt and the waits between them
+        deadline = asyncio.get_event_loop().time() + self.timeout
+
+        return await asyncio.wait_for(self._attempts(method, url, kwargs, deadline), self.timeout)
+
+    async def _attempts(self, method, url, kwargs, deadline):
+        loop = asyncio.get_event_loop()
+        retries = self.retries if method in IDEMPOTENT_METHODS else 0
+
+        for attempt in range(retries + 1):
+            delay = self.backoff * 2 ** attempt
+
+            try:
+                async with self.session.request(method, url, **kwargs) as resp:
+                    body = await resp.read()
+                    response = Response(method, url, resp.status, CIMultiDict(resp.headers), body)
+
+                if response.status not in RETRY_STATUSES or attempt == retries:
+                    return response
+
+                try:  # use the server's delay if it gave one
+                    delay = max(0.0, float(response.headers.get("Retry-After", delay)))
+                except ValueError:  # http date
+                    pass
+
+                # don't wait longer than max_retry_after, or past the deadline, just to retry
+                if delay > self.max_retry_after or (deadline is not None and loop.time() + delay >= deadline):
+                    return response
+
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == retries or (deadline is not None and loop.time() + delay >= deadline):
+                    raise
+
+            await asyncio.sleep(delay)
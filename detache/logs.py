@@ -0,0 +1,130 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import logging
+import logging.handlers
+import queue
+import sys
+
+# record attributes added by the framework with the extra keyword
+STRUCTURED_FIELDS = ("kind", "event", "guild", "command", "latency")
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Formatter that appends the framework's structured fields to each message as key=value pairs, i.e. ::
+
+        2018-06-11 14:56:03,123:DEBUG:outlet: command finished kind=command guild=1234 command='add' latency=0.0021
+    """
+
+    def __init__(self, fmt="%(asctime)s:%(levelname)s:%(name)s: %(message)s", datefmt=None, fields=STRUCTURED_FIELDS):
+        super().__init__(fmt, datefmt)
+
+        self.fields = fields
+
+    def format(self, record):
+        message = super().format(record)
+
+        pairs = []
+        for field in self.fields:
+            value = getattr(record, field, None)
+
+            if value is not None:
+                pairs.append("{}={!r}".format(field, value))
+
+        if pairs:
+            message += " " + " ".join(pairs)
+
+        return message
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of records of each kind. Records without a kind are always kept.
+
+    :param dict rates: Fraction of records to keep for each kind, i.e. ``{"event": 0.01}`` keeps 1 in 100 event records.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+
+        # keep every nth record of each kind
+        self.every = {kind: max(1, round(1 / rate)) if rate > 0 else 0 for kind, rate in rates.items()}
+        self.counts = dict.fromkeys(rates, 0)
+
+    def filter(self, record):
+        kind = getattr(record, "kind", None)
+
+        every = self.every.get(kind)
+        if every is None:
+            return True
+
+        if every == 0:
+            return False
+
+        self.counts[kind] += 1
+
+        return self.counts[kind] % every == 1 or every == 1
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # the default QueueHandler formats records before queueing them, which is what this is supposed to avoid.
+    # records are formatted by the writer thread instead, so log arguments should not be mutated after logging them
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, *, handler=None, formatter=None, sample=None, logger="outlet"):
+    """
+    Sets up the Detache log. Nothing is logged until this is called.
+
+    Records are put on a queue and written by a background thread, so logging never blocks the event loop on I/O.
+    Messages are formatted by the background thread too.
+
+    :param level: Logging level.
+    :param handler: (Keyword) (Optional) Handler that writes records. Defaults to printing to stdout.
+    :param formatter: (Keyword) (Optional) Formatter for the handler. Defaults to :class:`KeyValueFormatter`.
+    :param dict sample: (Keyword) (Optional) Rates for a :class:`SamplingFilter`, i.e. ``{"event": 0.01}``
+    :param logger: (Keyword) Logger or logger name.
+    :returns: logging.handlers.QueueListener running the background thread. Call its stop method to flush the queue
+              before exiting.
+    """
+
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+
+    handler = handler or logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formatter or KeyValueFormatter())
+
+    records = queue.Queue()
+
+    queue_handler = _QueueHandler(records)
+    if sample:
+        queue_handler.addFilter(SamplingFilter(sample))
+
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+
+    return listener
@@ -0,0 +1,247 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+
+from detache import compat, diagnostics
+
+default_log = logging.getLogger("outlet")
+
+
+class MemberCache(object):
+    """
+    Member cache policy. Keeps members who sent a message or were looked up recently, and removes the rest from
+    discord.py's member cache. Converters fetch members that aren't cached, so commands work the same either way.
+
+    Use :meth:`Bot.limit_member_cache` instead of creating this directly.
+
+    The bot's own member and members in voice channels are never removed. Needs discord.py 1.7.3 or later.
+
+    :param bot: Bot whose member cache is limited.
+    :param float ttl: (Keyword) (Optional) Seconds a member is kept after they were last seen.
+    :param int max_per_guild: (Keyword) (Optional) Most members kept per guild. Least recently seen are removed first.
+    :param float interval: (Keyword) (Optional) Seconds between sweeps of the cache. Defaults to a quarter of ttl, or a
+                           minute.
+    :param logger: (Keyword) Logging object.
+    """
+
+    def __init__(self, bot, *, ttl=None, max_per_guild=None, interval=None, logger=default_log):
+        if ttl is None and max_per_guild is None:
+            raise ValueError("member cache needs a ttl or max_per_guild")
+
+        compat.check_member_cache()
+
+        self.bot = bot
+
+        self.ttl = ttl
+        self.max_per_guild = max_per_guild
+
+        if interval is None:
+            interval = min(ttl / 4, 60) if ttl is not None else 60
+        self.interval = interval
+
+        self.log = logger
+
+        self._seen = {}  # guild id -> OrderedDict of member id -> time last seen, least recently seen first
+
+        self._timer = None
+
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.evicted = 0
+
+    @property
+    def running(self):
+        return self._timer is not None
+
+    def start(self):
+        """Starts sweeping the cache. Must be called from the event loop."""
+
+        if not self.running:
+            self._timer = self.bot.loop.call_later(self.interval, self._sweep)
+
+    def stop(self):
+        """Stops sweeping the cache."""
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def seen(self, member):
+        """
+        Marks a member as active, and puts them back in the guild's member cache if they were removed.
+
+        :param discord.Member member: Member.
+        """
+
+        guild = member.guild
+
+        seen = self._seen.get(guild.id)
+        if seen is None:
+            seen = self._seen[guild.id] = OrderedDict()
+
+        seen[member.id] = time.monotonic()
+        seen.move_to_end(member.id)
+
+        if guild.get_member(member.id) is None:
+            compat.add_member(guild, member)
+
+        if self.max_per_guild is not None and len(seen) > self.max_per_guild:
+            self._evict(guild, seen, len(seen) - self.max_per_guild, None)
+
+    def forget(self, guild_id):
+        """Stops tracking a guild, i.e. when the bot leaves it."""
+
+        self._seen.pop(guild_id, None)
+
+    async def get_member(self, guild, user_id):
+        """
+        Returns a member by ID, from the cache or fetched from Discord.
+
+        :returns: :class:`discord.Member`, or None if they aren't in the guild.
+        """
+
+        member = guild.get_member(user_id)
+
+        if member is None:
+            self.misses += 1
+
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                return None
+
+            self.fetched += 1
+        else:
+            self.hits += 1
+
+        self.seen(member)
+
+        return member
+
+    async def get_member_named(self, guild, name):
+        """
+        Returns a member by name#discriminator, from the cache or fetched from Discord.
+
+        :returns: :class:`discord.Member`, or None if they aren't found.
+        """
+
+        member = guild.get_member_named(name)
+
+        if member is None:
+            self.misses += 1
+
+            username, _, discriminator = name.rpartition("#")
+
+            try:
+                found = await guild.query_members(username, limit=10, cache=False)
+            except (discord.ClientException, discord.HTTPException, ValueError):  # i.e. intents or timed out
+                return None
+
+            member = discord.utils.get(found, name=username, discriminator=discriminator)
+
+            if member is None:
+                return None
+
+            self.fetched += 1
+        else:
+            self.hits += 1
+
+        self.seen(member)
+
+        return member
+
+    def _protected(self, guild, member_id):
+        return member_id == self.bot.user.id or compat.in_voice(guild, member_id)
+
+    def _evict(self, guild, seen, count, before):
+        # removes up to count least recently seen members, or every member seen before a time if count is None
+
+        for member_id in list(seen):
+            if count is not None:
+                if count <= 0:
+                    break
+            elif seen[member_id] >= before:
+                break
+
+            if self._protected(guild, member_id):
+                seen.move_to_end(member_id)  # protected members stay, and don't hold back the rest
+                continue
+
+            del seen[member_id]
+
+            member = guild.get_member(member_id)
+            if member is not None:
+                compat.remove_member(guild, member)
+                self.evicted += 1
+
+            if count is not None:
+                count -= 1
+
+    def _sweep(self):
+        self._timer = self.bot.loop.call_later(self.interval, self._sweep)
+
+        if self.bot.user is None:  # not logged in yet
+            return
+
+        now = time.monotonic()
+
+        for guild in self.bot.guilds:
+            seen = self._seen.get(guild.id)
+            if seen is None:
+                seen = self._seen[guild.id] = OrderedDict()
+
+            # members cached by discord.py without being seen here, i.e. from guild chunks, count as seen now
+            for member_id in compat.cached_member_ids(guild) - seen.keys():
+                seen[member_id] = now
+
+            if self.ttl is not None:
+                self._evict(guild, seen, None, now - self.ttl)
+
+            if self.max_per_guild is not None and len(seen) > self.max_per_guild:
+                self._evict(guild, seen, len(seen) - self.max_per_guild, None)
+
+        # guilds the bot left
+        for guild_id in self._seen.keys() - {guild.id for guild in self.bot.guilds}:
+            del self._seen[guild_id]
+
+    def metrics(self):
+        """
+        Returns a dict of members cached, converter hits and misses, members fetched and evicted, and the process's
+        resident memory in bytes.
+        """
+
+        lookups = self.hits + self.misses
+
+        return {
+            "members": sum(len(compat.cached_member_ids(guild)) for guild in self.bot.guilds),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "fetched": self.fetched,
+            "evicted": self.evicted,
+            "rss": diagnostics.rss(),
+        }
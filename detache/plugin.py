@@ -18,10 +18,137 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import functools
+import logging
+
 import discord
 
+from detache import diagnostics
+from detache.checks import CheckPipeline
 from detache.command import CommandInherit
-from detache.wrappers import EventListenerInherit, BgTaskInherit
+from detache.http_client import HTTPClient
+from detache.wrappers import EventListenerInherit, BgTaskInherit, CheckInherit, TriggerInherit
+
+
+def guild_id_of(args):
+    """
+    Returns the ID of the guild an event happened in, or None if it didn't happen in a guild.
+
+    :param args: Event arguments.
+    """
+
+    for arg in args:
+        if isinstance(arg, discord.Guild):
+            return arg.id
+
+        guild = getattr(arg, "guild", None)
+        if guild is not None:
+            return guild.id
+
+        guild_id = getattr(arg, "guild_id", None)  # raw events
+        if guild_id is not None:
+            return guild_id
+
+    return None
+
+
+class GuildLanes(object):
+    """
+    Runs coroutines in a fixed number of ordered lanes. Work for a guild always goes to the same lane, so it runs one at
+    a time in the order it was submitted, while work for guilds in other lanes runs in parallel.
+
+    :param int lanes: Number of lanes.
+    :param logger: Logging object used to report errors.
+    """
+
+    def __init__(self, lanes, logger):
+        if lanes < 1:
+            raise ValueError("there must be at least 1 lane")
+
+        self.log = logger
+
+        self._queues = [None] * lanes
+        self._workers = [None] * lanes
+
+        #: number of coroutines finished by each lane
+        self.processed = [0] * lanes
+        #: highest queue depth seen by each lane
+        self.max_depth = [0] * lanes
+
+    def __len__(self):
+        return len(self._queues)
+
+    def lane_for(self, guild_id):
+        """Returns the index of the lane used by a guild. DMs and other events without a guild use lane 0."""
+
+        if guild_id is None:
+            return 0
+
+        # use the timestamp part of the snowflake, the low bits are mostly zero
+        return (guild_id >> 22) % len(self._queues)
+
+    def submit(self, guild_id, coroutine):
+        """
+        Queues a coroutine to be run in a guild's lane.
+
+        :param int guild_id: Guild ID, or None.
+        :param coroutine: Coroutine to run.
+        """
+
+        lane = self.lane_for(guild_id)
+
+        queue = self._queues[lane]
+        if queue is None:  # lanes are started lazily, so they're created in the running loop
+            queue = self._queues[lane] = asyncio.Queue()
+            self._workers[lane] = asyncio.ensure_future(self._work(lane, queue))
+
+        queue.put_nowait(coroutine)
+
+        depth = queue.qsize()
+        if depth > self.max_depth[lane]:
+            self.max_depth[lane] = depth
+
+    def depths(self):
+        """Returns the number of queued coroutines in each lane."""
+
+        return [0 if queue is None else queue.qsize() for queue in self._queues]
+
+    def metrics(self):
+        """Returns a list of dicts with the depth, max depth, and number of processed coroutines for each lane."""
+
+        return [
+            {"depth": depth, "max_depth": max_depth, "processed": processed}
+            for depth, max_depth, processed in zip(self.depths(), self.max_depth, self.processed)
+        ]
+
+    async def _work(self, lane, queue):
+        while True:
+            coroutine = await queue.get()
+
+            try:
+                await coroutine
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.log.exception("error in guild lane %d", lane)
+            finally:
+                self.processed[lane] += 1
+
+    def close(self):
+        """Stops all lanes. Queued coroutines are discarded."""
+
+        for lane, queue in enumerate(self._queues):
+            if queue is None:
+                continue
+
+            self._workers[lane].cancel()
+
+            while not queue.empty():
+                queue.get_nowait().close()
+
+            self._queues[lane] = None
+            self._workers[lane] = None
 
 
 class Plugin:
@@ -29,20 +156,51 @@ class Plugin:
     Plugin class. Create your own plugins by inheriting this class.
     """
 
+    #: unique name of the plugin. defaults to the class name
     __plugin_name__ = "Plugin"
 
+    #: whether the plugin is enabled in guilds that haven't toggled it. see :class:`detache.toggles.GuildToggles`
+    __enabled_by_default__ = True
+
+    #: number of lanes used for ordered event listeners and commands
+    __lanes__ = 8
+
+    #: keywords for a :class:`detache.http_client.HTTPClient` just for this plugin. if None, the bot's is shared
+    __http__ = None
+
+    #: names of plugins whose :meth:`__setup__` must finish before this plugin's starts
+    __requires__ = ()
+
+    #: attribute name -> :class:`detache.resources.Resource`, or None for a pool already added to the bot's resources.
+    #: each becomes an attribute holding the shared :class:`detache.resources.Pool`
+    __resources__ = {}
+
     def __init__(self, bot):
+        if self.__plugin_name__ == Plugin.__plugin_name__:  # not named
+            self.__plugin_name__ = type(self).__name__
+
         #: Bot the plugin belongs to
         self.bot = bot
 
-        #: aiohttp.ClientSession to be used for any HTTP requests
-        self.http = self.bot.http_session
+        #: :class:`detache.http_client.HTTPClient` to be used for any HTTP requests
+        self.http = self.bot.http_session if self.__http__ is None else HTTPClient(**self.__http__)
 
         self.log = self.bot.log
 
+        for name, resource in self.__resources__.items():
+            setattr(self, name, self.bot.resources.declare(name, resource))
+
+        #: :class:`GuildLanes` that ordered event listeners and commands run in
+        self.lanes = GuildLanes(self.__lanes__, self.log)
+
+        #: (kind, name) -> [calls, cpu seconds], while the bot's watchdog is running
+        self.timings = {}
+
         self.commands = self.find_commands()
         self.event_listeners = self.find_event_listeners()
         self.bg_tasks = self.find_bg_tasks()
+        self.checks = self.find_checks()
+        self.triggers = self.find_triggers()
 
     def __repr__(self):
         return "Plugin({!r})".format(self.__plugin_name__)
@@ -50,7 +208,7 @@ class Plugin:
     def find_commands(self):
         """Returns dict of commands."""
 
-        self.log.debug("finding commands in {!r}".format(self))
+        self.log.debug("finding commands in %r", self)
 
         commands = {}
 
@@ -60,14 +218,14 @@ class Plugin:
                 o.plugin = self
                 commands[o.name] = o
 
-                self.log.debug("found command: {!r}".format(o.name))
+                self.log.debug("found command: %r", o.name)
 
         return commands
 
     def find_event_listeners(self):
         """Returns dict of event listeners."""
 
-        self.log.debug("finding event listeners in {!r}".format(self))
+        self.log.debug("finding event listeners in %r", self)
 
         listeners = {}
         # example:
@@ -84,14 +242,14 @@ class Plugin:
 
                 listeners[o.event].append(o)
 
-                self.log.debug("found event listener")
+                self.log.debug("found event listener: %r", o.event)
 
         return listeners
 
     def find_bg_tasks(self):
         """Returns dict of background tasks."""
 
-        self.log.debug("finding background tasks in {!r}".format(self))
+        self.log.debug("finding background tasks in %r", self)
 
         tasks = {}
 
@@ -100,10 +258,42 @@ class Plugin:
             if issubclass(o.__class__, BgTaskInherit):  # check for command objects
                 tasks[o.id] = o
 
-                self.log.debug("found background task: {!r}".format(o.id))
+                self.log.debug("found background task: %r", o.id)
 
         return tasks
 
+    def find_checks(self):
+        """Returns :class:`detache.checks.CheckPipeline` of checks run before the plugin's commands."""
+
+        self.log.debug("finding checks in %r", self)
+
+        checks = CheckPipeline()
+
+        for name in dir(self):
+            o = getattr(self, name)
+            if issubclass(o.__class__, CheckInherit):  # check for check objects
+                checks.add(functools.partial(o.func, self), name="{}.{}".format(self.__plugin_name__, name))
+
+                self.log.debug("found check: %r", name)
+
+        return checks
+
+    def find_triggers(self):
+        """Returns list of triggers."""
+
+        self.log.debug("finding triggers in %r", self)
+
+        triggers = []
+
+        for name in dir(self):
+            o = getattr(self, name)
+            if issubclass(o.__class__, TriggerInherit):  # check for trigger objects
+                triggers.append(o)
+
+                self.log.debug("found trigger: %r", o.pattern)
+
+        return triggers
+
     def create_task(self, *args, **kwargs):
         """
         Shortcut to :meth:`Plugin.bot.loop.create_task`
@@ -115,20 +305,85 @@ class Plugin:
 
         return self.bot.loop.create_task(*args, **kwargs)
 
+    def timed(self, coroutine, kind, name):
+        """
+        If the bot's watchdog is running, wraps a coroutine so its cpu time is added to :attr:`Plugin.timings`.
+        Otherwise, returns the coroutine.
+
+        :param coroutine: Coroutine.
+        :param str kind: Kind of code, i.e. "command"
+        :param str name: Name of the command, event listener, etc.
+        """
+
+        watchdog = self.bot.watchdog
+
+        if watchdog is None or not watchdog.running:
+            return coroutine
+
+        return diagnostics.timed(coroutine, self.timings, (kind, name))
+
     # event pre-processing, command handling
 
     async def __on_event__(self, event, *args, **kwargs):
         # triggers event listeners
 
         for listener in self.event_listeners.get(event, []):  # empty list if no event listeners
-            self.create_task(listener.execute(self, *args, **kwargs))  # use plugin as self arg
+            if listener.ordered:  # run in the guild's lane
+                self.lanes.submit(guild_id_of(args), listener.execute(self, *args, **kwargs))
+            else:
+                self.create_task(listener.execute(self, *args, **kwargs))  # use plugin as self arg
 
-            self.log.debug("{!r} event listener triggered".format(event))
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug("%r event listener triggered", event,
+                               extra={"kind": "event", "event": event, "guild": guild_id_of(args)})
+
+    async def __setup__(self):
+        """
+        Coroutine
+
+        Called once before the bot connects, i.e. to open database pools or warm caches. Plugins are set up
+        concurrently, except that a plugin waits for the plugins named in its ``__requires__``.
+        """
+
+        pass
+
+    async def __teardown__(self):
+        """
+        Coroutine
+
+        Called when the bot closes, in the reverse of the order plugins finished setting up.
+        """
+
+        pass
+
+    def __snapshot__(self):
+        """
+        Returns picklable state to save in the bot's snapshot when it closes, or None. Only called if the bot has a
+        snapshot_file.
+        """
+
+        return None
+
+    def __restore__(self, state, age):
+        """
+        Restores the state returned by :meth:`__snapshot__` when the bot starts, before :meth:`__setup__`.
+
+        :param state: State from the snapshot.
+        :param float age: Seconds since the snapshot was taken.
+        """
+
+        pass
 
     async def __on_ready__(self):
         for task in self.bg_tasks.values():
             task.restart(self.bot.loop, self)
 
+    async def __on_resumed__(self):
+        # after a resume, state is intact so only background tasks that stopped are started
+        for task in self.bg_tasks.values():
+            if not task.running:
+                task.start(self.bot.loop, self)
+
     async def __on_shard_ready__(self):
         pass
 
@@ -0,0 +1,378 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import inspect
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from detache import errors
+
+
+class Resource(object):
+    """
+    Declares a pooled resource for a plugin's ``__resources__``. Plugins that declare a resource with the same name
+    share one pool, sized by the first declaration. ::
+
+        class Stats(detache.Plugin):
+            __resources__ = {"db": detache.Resource(detache.resources.sqlite("stats.db"), size=4)}
+
+            async def __setup__(self):
+                async with self.db.acquire() as db:
+                    await db.execute("CREATE TABLE IF NOT EXISTS uses (command TEXT, count INTEGER)")
+
+    :param factory: Coroutine function that opens one resource, i.e. a database connection.
+    :param int size: (Optional) Most resources open at once. Defaults to 10.
+    :param close: (Optional) Function or coroutine function that closes a resource. By default, the resource's close
+                  method is called if it has one.
+    """
+
+    __slots__ = ["factory", "size", "close"]
+
+    def __init__(self, factory, size=10, close=None):
+        self.factory = factory
+        self.size = size
+        self.close = close
+
+
+class _Acquire(object):
+    # awaitable, or async context manager that releases the resource
+    __slots__ = ["_pool", "_resource"]
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._resource = None
+
+    def __await__(self):
+        return self._pool._acquire().__await__()
+
+    async def __aenter__(self):
+        self._resource = await self._pool._acquire()
+
+        return self._resource
+
+    async def __aexit__(self, *exc_info):
+        self._pool.release(self._resource)
+
+
+class Pool(object):
+    """
+    Pool of resources opened by an async factory. Resources are opened as they're needed, up to size, and reused
+    after being released.
+
+    :param str name: Name of the pool.
+    :param factory: Coroutine function that opens one resource.
+    :param int size: (Optional) Most resources open at once. Defaults to 10.
+    :param close: (Optional) Function or coroutine function that closes a resource.
+    """
+
+    def __init__(self, name, factory, size=10, close=None):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+
+        self.name = name
+
+        self.factory = factory
+        self.size = size
+        self._close = close
+
+        self._idle = deque()
+        self._waiters = deque()  # futures of acquires waiting for a resource
+
+        self._closed = False
+
+        #: resources opened and not closed
+        self.opened = 0
+        #: resources acquired and not released
+        self.in_use = 0
+
+        self.acquires = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def __repr__(self):
+        return "Pool({!r}, size={})".format(self.name, self.size)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def acquire(self):
+        """
+        Acquires a resource, waiting for one to be released if size are in use. Await it, and pass the resource to
+        :meth:`release` when done, or use it as an async context manager to release it automatically. ::
+
+            async with pool.acquire() as db:
+                ...
+        """
+
+        return _Acquire(self)
+
+    async def _acquire(self):
+        if self._closed:
+            raise errors.DetacheException("{!r} is closed.".format(self))
+
+        start = time.perf_counter()
+
+        while True:
+            if self._idle:
+                resource = self._idle.pop()  # most recently used first, so idle resources stay idle
+                break
+
+            if self.opened < self.size:
+                self.opened += 1
+
+                try:
+                    resource = await self.factory()
+                except BaseException:
+                    self.opened -= 1
+                    self._hand_over(None)  # a waiter can try to open one instead
+
+                    raise
+
+                break
+
+            future = asyncio.get_event_loop().create_future()
+            self._waiters.append(future)
+
+            try:
+                resource = await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():  # cancelled after being handed a resource
+                    self._hand_over(future.result())
+                elif future in self._waiters:
+                    self._waiters.remove(future)
+
+                raise
+
+            if resource is not None:
+                break
+
+        wait = time.perf_counter() - start
+
+        self.acquires += 1
+        self.wait_time += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+        self.in_use += 1
+
+        return resource
+
+    def release(self, resource):
+        """
+        Returns a resource to the pool.
+        """
+
+        self.in_use -= 1
+
+        if self._closed:
+            asyncio.ensure_future(self._close_resource(resource))
+        else:
+            self._hand_over(resource)
+
+    def _hand_over(self, resource):
+        # gives a resource to the longest waiting acquire, or None to let it open one
+        while self._waiters:
+            future = self._waiters.popleft()
+
+            if not future.done():
+                future.set_result(resource)
+                return
+
+        if resource is not None:
+            self._idle.append(resource)
+
+    async def _close_resource(self, resource):
+        self.opened -= 1
+
+        if self._close is not None:
+            result = self._close(resource)
+        elif hasattr(resource, "close"):
+            result = resource.close()
+        else:
+            return
+
+        if inspect.isawaitable(result):
+            await result
+
+    async def close(self):
+        """
+        Closes idle resources. Resources in use are closed when they're released.
+        """
+
+        self._closed = True
+
+        for future in self._waiters:
+            if not future.done():
+                future.set_exception(errors.DetacheException("{!r} is closed.".format(self)))
+        self._waiters.clear()
+
+        while self._idle:
+            await self._close_resource(self._idle.pop())
+
+    def metrics(self):
+        """
+        Returns a dict of resources opened and in use, acquires, and the total and highest seconds acquires waited.
+        """
+
+        return {
+            "size": self.size,
+            "opened": self.opened,
+            "in_use": self.in_use,
+            "waiting": len(self._waiters),
+            "acquires": self.acquires,
+            "wait_time": self.wait_time,
+            "max_wait": self.max_wait,
+        }
+
+
+class ResourceRegistry(object):
+    """
+    Pools shared by every plugin. :class:`detache.Bot` has one at :attr:`Bot.resources`, and closes it when the bot
+    closes.
+    """
+
+    def __init__(self):
+        self._pools = {}
+
+    def __contains__(self, name):
+        return name in self._pools
+
+    def __getitem__(self, name):
+        return self._pools[name]
+
+    def __iter__(self):
+        return iter(self._pools.values())
+
+    def add(self, name, factory, size=10, close=None):
+        """
+        Adds a pool. Takes the same arguments as :class:`Pool`.
+
+        :returns: :class:`Pool`
+        """
+
+        if name in self._pools:
+            raise errors.DetacheException("There's already a resource named {}.".format(name))
+
+        pool = self._pools[name] = Pool(name, factory, size, close)
+
+        return pool
+
+    def declare(self, name, resource):
+        """
+        Returns the pool with a name, adding it from a :class:`Resource` if there isn't one.
+        """
+
+        if name in self._pools:
+            return self._pools[name]
+
+        if resource is None:
+            raise errors.DetacheException("There's no resource named {}.".format(name))
+
+        return self.add(name, resource.factory, resource.size, resource.close)
+
+    async def close(self):
+        """Closes every pool."""
+
+        for pool in self._pools.values():
+            await pool.close()
+
+    def metrics(self):
+        """Returns a dict of pool name -> :meth:`Pool.metrics`."""
+
+        return {name: pool.metrics() for name, pool in self._pools.items()}
+
+
+class SQLiteConnection(object):
+    """
+    sqlite3 connection that runs queries in its own thread, so they don't block the event loop. Opened by
+    :func:`sqlite`.
+    """
+
+    def __init__(self, path, **kwargs):
+        self._executor = ThreadPoolExecutor(1)  # sqlite3 connections must stay on one thread
+        self._connection = None
+
+        self.path = path
+        self._kwargs = kwargs
+
+    def _run(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    async def connect(self):
+        self._connection = await self._run(lambda: sqlite3.connect(self.path, **self._kwargs))
+
+        return self
+
+    async def execute(self, sql, parameters=()):
+        """
+        Coroutine
+
+        Runs a query, and returns its rows as a list.
+        """
+
+        return await self._run(lambda: self._connection.execute(sql, parameters).fetchall())
+
+    async def executemany(self, sql, parameters):
+        """
+        Coroutine
+
+        Runs a query once for each set of parameters.
+        """
+
+        await self._run(self._connection.executemany, sql, parameters)
+
+    async def commit(self):
+        """Coroutine"""
+
+        await self._run(self._connection.commit)
+
+    async def rollback(self):
+        """Coroutine"""
+
+        await self._run(self._connection.rollback)
+
+    async def close(self):
+        """Coroutine"""
+
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+
+        self._executor.shutdown(wait=False)
+
+
+def sqlite(path, **kwargs):
+    """
+    Returns a factory of :class:`SQLiteConnection` for a :class:`Pool` or :class:`Resource`. Good for trying pooled
+    resources locally before using a database server.
+
+    :param str path: Database file, or ":memory:".
+    :param kwargs: Keywords for sqlite3.connect.
+    """
+
+    async def factory():
+        return await SQLiteConnection(path, **kwargs).connect()
+
+    return factory
@@ -0,0 +1,81 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import functools
+
+
+class SingleFlight(object):
+    """
+    Shares one call of a coroutine function between everything asking for the same key at the same time, i.e.
+    identical requests or command uses.
+
+    The call runs as its own task, so a caller that's cancelled or times out doesn't cancel it for the others. It's
+    only cancelled once every caller waiting for it has gone.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> [task, number of callers waiting]
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def run(self, key, func, *args, **kwargs):
+        """
+        Coroutine
+
+        Returns the result of func(*args, **kwargs), sharing the call with anything already waiting for key.
+        """
+
+        call = self._calls.get(key)
+
+        if call is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(functools.partial(self._done, key))
+
+            call = self._calls[key] = [task, 0]
+
+        task = call[0]
+        call[1] += 1
+
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+
+            if call[1] == 0 and not task.done():  # nobody wants the result anymore
+                task.cancel()
+                self._forget(key, task)
+
+    def _forget(self, key, task):
+        call = self._calls.get(key)
+
+        if call is not None and call[0] is task:
+            del self._calls[key]
+
+    def _done(self, key, task):
+        self._forget(key, task)
+
+        if not task.cancelled():
+            task.exception()  # mark as retrieved, the callers that were waiting have it
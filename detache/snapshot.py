@@ -0,0 +1,120 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+
+default_log = logging.getLogger("outlet")
+
+MAGIC = b"DETACHE-SNAPSHOT"
+
+#: snapshots written with a different version aren't loaded
+VERSION = 1
+
+# magic, version, time.time() the snapshot was taken
+_header = struct.Struct(">{}sHd".format(len(MAGIC)))
+
+
+class SnapshotFile(object):
+    """
+    File the bot's caches are saved to when it closes, and loaded from when it starts, so a restarted bot doesn't
+    start cold. Used by :class:`detache.Bot` when it's given a snapshot_file.
+
+    The snapshot is a pickle, so only load snapshots the bot wrote itself.
+
+    :param str path: Path to the file.
+    :param float max_age: (Optional) Seconds after which a snapshot is too old to load. Defaults to 600.
+    :param logger: (Optional) Logging object.
+    """
+
+    def __init__(self, path, max_age=600, logger=default_log):
+        self.path = path
+        self.max_age = max_age
+
+        self.log = logger
+
+    def save(self, state):
+        """
+        Writes a snapshot.
+
+        :param state: Picklable object.
+        """
+
+        payload = zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+        # write then rename, so a crash while writing doesn't leave half a snapshot
+        with open(self.path + ".tmp", "wb") as file:
+            file.write(_header.pack(MAGIC, VERSION, time.time()))
+            file.write(payload)
+
+        os.replace(self.path + ".tmp", self.path)
+
+    def load(self):
+        """
+        Reads the snapshot.
+
+        :returns: (state, seconds since it was taken), or None if there's no snapshot or it can't be used.
+        """
+
+        try:
+            with open(self.path, "rb") as file:
+                header = file.read(_header.size)
+                payload = file.read()
+        except FileNotFoundError:
+            return None
+
+        if len(header) < _header.size:
+            self.log.warning("snapshot %s is truncated, ignoring it", self.path)
+            return None
+
+        magic, version, taken = _header.unpack(header)
+
+        if magic != MAGIC or version != VERSION:
+            self.log.warning("snapshot %s is from a different version, ignoring it", self.path)
+            return None
+
+        age = time.time() - taken
+        if age > self.max_age or age < 0:
+            self.log.info("snapshot %s is %.0fs old, ignoring it", self.path, age)
+            return None
+
+        try:
+            state = pickle.loads(zlib.decompress(payload))
+        except Exception:
+            self.log.exception("snapshot %s couldn't be read, ignoring it", self.path)
+            return None
+
+        return state, age
+
+
+def picklable(obj):
+    """Returns whether an object can be pickled."""
+
+    try:
+        pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+
+    return True
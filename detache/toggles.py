@@ -0,0 +1,171 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+
+from detache.util import JSONFile
+
+
+class ToggleStore(object):
+    """
+    Where :class:`GuildToggles` are saved. This one keeps them in memory only; inherit it and override :meth:`load` and
+    :meth:`save` to keep them in a database.
+    """
+
+    async def load(self):
+        """
+        Coroutine
+
+        :returns: Iterable of (guild_id, kind, name, enabled) tuples. kind is "plugin" or "command".
+        """
+
+        return []
+
+    async def save(self, guild_id, kind, name, enabled):
+        """
+        Coroutine
+
+        Saves a toggle.
+        """
+
+        pass
+
+
+class FileToggleStore(ToggleStore):
+    """
+    Saves toggles in a JSON file.
+
+    :param str path: Path to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._file = JSONFile(path)
+        self._toggles = {}  # "guild_id kind name" -> enabled
+
+    async def load(self):
+        self._toggles = await asyncio.get_event_loop().run_in_executor(None, self._file.read, {})
+
+        toggles = []
+        for key, enabled in self._toggles.items():
+            guild_id, kind, name = key.split(" ", 2)
+
+            toggles.append((int(guild_id), kind, name, enabled))
+
+        return toggles
+
+    async def save(self, guild_id, kind, name, enabled):
+        self._toggles["{} {} {}".format(guild_id, kind, name)] = enabled
+
+        await self._file.save(dict(self._toggles))
+
+
+class GuildToggles(object):
+    """
+    Per-guild plugin and command toggles. The bot checks these before creating any tasks for an event or command, so
+    plugins don't need to check if they're enabled themselves.
+
+    For each plugin and command, only the guilds that toggled it are stored, so every check is at most one dict lookup.
+    :class:`detache.Bot` has one at :attr:`Bot.toggles`.
+
+    :param store: (Optional) :class:`ToggleStore` to load and save toggles with.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or ToggleStore()
+
+        self._defaults = {}  # (kind, name) -> enabled by default
+        self._toggled = {}  # (kind, name) -> {guild id: enabled}
+
+    def set_default(self, kind, name, enabled):
+        """
+        Sets whether a plugin or command is enabled in guilds that haven't toggled it.
+
+        :param str kind: "plugin" or "command"
+        :param str name: Name of the plugin or command.
+        :param bool enabled: Whether it's enabled by default.
+        """
+
+        self._defaults[(kind, name)] = enabled
+
+    def enabled(self, guild_id, kind, name):
+        """
+        Returns whether a plugin or command is enabled in a guild.
+
+        :param int guild_id: Guild ID. Everything is enabled if this is None.
+        :param str kind: "plugin" or "command"
+        :param str name: Name of the plugin or command.
+        """
+
+        if guild_id is None:
+            return True
+
+        target = (kind, name)
+
+        toggled = self._toggled.get(target)
+        if toggled is not None:
+            enabled = toggled.get(guild_id)
+
+            if enabled is not None:
+                return enabled
+
+        return self._defaults.get(target, True)
+
+    def snapshot(self):
+        """Returns the toggles, for :class:`detache.Bot` snapshots."""
+
+        return {target: dict(toggled) for target, toggled in self._toggled.items()}
+
+    def restore(self, toggles):
+        """Sets the toggles from :meth:`snapshot`. Toggles loaded from the store afterwards take precedence."""
+
+        for target, toggled in toggles.items():
+            self._toggled.setdefault(target, {}).update(toggled)
+
+    def _set(self, guild_id, kind, name, enabled):
+        self._toggled.setdefault((kind, name), {})[guild_id] = enabled
+
+    async def set(self, guild_id, kind, name, enabled):
+        """
+        Coroutine
+
+        Enables or disables a plugin or command in a guild, and saves it in the store.
+
+        :param int guild_id: Guild ID.
+        :param str kind: "plugin" or "command"
+        :param str name: Name of the plugin or command.
+        :param bool enabled: Whether it's enabled.
+        """
+
+        self._set(guild_id, kind, name, enabled)
+
+        await self.store.save(guild_id, kind, name, enabled)
+
+    async def load(self):
+        """
+        Coroutine
+
+        Loads toggles from the store.
+        """
+
+        for guild_id, kind, name, enabled in await self.store.load():
+            self._set(guild_id, kind, name, enabled)
@@ -0,0 +1,235 @@
+# Copyright (c) 2018 James Patrick Dill
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import re
+
+
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton. Finds every occurrence of many keywords in one pass over the text.
+
+    :param keywords: Iterable of keywords.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+
+        self._goto = [{}]  # node -> {char: node}
+        self._fail = [0]
+        self._out = [()]  # node -> keyword indexes that end at this node
+
+        for index, keyword in enumerate(self.keywords):
+            self._add(index, keyword)
+
+        self._link()
+
+    def _add(self, index, keyword):
+        node = 0
+
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+
+            if next_node is None:
+                next_node = len(self._goto)
+
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+
+                self._goto[node][char] = next_node
+
+            node = next_node
+
+        self._out[node] += (index,)
+
+    def _link(self):
+        # breadth first, so a node's fail link is always set before its children's
+        queue = list(self._goto[0].values())
+
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail if fail != child else 0
+
+                self._out[child] += self._out[self._fail[child]]
+
+    def search(self, text):
+        """
+        Returns the set of indexes of keywords found in text.
+
+        :param str text: Text to search.
+        """
+
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+
+        found = set()
+        node = 0
+
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+
+            node = goto[node].get(char, 0)
+
+            if out[node]:
+                found.update(out[node])
+
+        return found
+
+
+# unescaped \1-\99, (?P=name) or (?(1)...), which refer to groups by number or name
+_group_reference = re.compile(r"(?:^|[^\\])(?:\\\\)*\\[1-9]|\(\?P=|\(\?\(")
+
+
+class _RegexSet(object):
+    # many regexes compiled into one alternation, so messages that match none of them (most) are only scanned once.
+    # capturing groups stop re from optimizing the alternation, so it only finds where a match starts, and the
+    # trigger's own pattern is matched there.
+    # combining renumbers groups, so patterns that refer to their groups are left out and searched one at a time
+
+    def __init__(self, patterns, flags):
+        self.patterns = [re.compile(pattern, flags) for pattern in patterns]
+
+        self._separate = [index for index, pattern in enumerate(self.patterns)
+                          if _group_reference.search(pattern.pattern)]
+        combined = [pattern.pattern for index, pattern in enumerate(self.patterns) if index not in self._separate]
+
+        self._combined = None
+        if combined:
+            try:
+                self._combined = re.compile("|".join("(?:{})".format(pattern) for pattern in combined), flags)
+            except re.error:  # i.e. group names used by more than one pattern, search one at a time
+                self._separate = list(range(len(self.patterns)))
+
+    def search(self, text):
+        # returns {pattern index: match}
+
+        found = {}
+        patterns = self.patterns
+
+        for index in self._separate:
+            match = patterns[index].search(text)
+
+            if match is not None:
+                found[index] = match
+
+        if self._combined is None or len(self._separate) == len(patterns):
+            return found
+
+        search = self._combined.search
+
+        pos = 0
+        while len(found) < len(patterns):
+            combined_match = search(text, pos)
+            if combined_match is None:
+                break
+
+            start = combined_match.start()
+
+            for index, pattern in enumerate(patterns):
+                if index not in found:
+                    match = pattern.match(text, start)
+
+                    if match is not None:
+                        found[index] = match
+
+            pos = start + 1  # matches can overlap
+
+        return found
+
+
+class TriggerIndex(object):
+    """
+    Every trigger registered by plugins, compiled so each message is only scanned once: keywords with an Aho-Corasick
+    automaton, and regexes with one combined pattern. :class:`detache.Bot` has one at :attr:`Bot.triggers`.
+
+    Each trigger fires at most once per message, with its first match.
+    """
+
+    def __init__(self):
+        self._triggers = []  # (plugin, trigger)
+
+        self._compiled = None
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def add(self, plugin, trigger):
+        """Adds a plugin's trigger."""
+
+        self._triggers.append((plugin, trigger))
+        self._compiled = None  # recompiled on next search
+
+    def _compile(self):
+        groups = {}  # (regex, ignore_case) -> [(plugin, trigger)]
+
+        for plugin, trigger in self._triggers:
+            groups.setdefault((trigger.regex, trigger.ignore_case), []).append((plugin, trigger))
+
+        compiled = []
+
+        for (regex, ignore_case), triggers in groups.items():
+            if regex:
+                matcher = _RegexSet([trigger.pattern for _, trigger in triggers], re.IGNORECASE if ignore_case else 0)
+            else:
+                matcher = AhoCorasick(trigger.pattern.lower() if ignore_case else trigger.pattern
+                                      for _, trigger in triggers)
+
+            compiled.append((regex, ignore_case, matcher, triggers))
+
+        self._compiled = compiled
+
+    def search(self, text):
+        """
+        Returns a list of (plugin, trigger, match) for every trigger in text. match is the keyword for keyword
+        triggers, and the re.Match for regex triggers.
+
+        :param str text: Message content.
+        """
+
+        if self._compiled is None:
+            self._compile()
+
+        matches = []
+        lowered = None
+
+        for regex, ignore_case, matcher, triggers in self._compiled:
+            if regex:
+                for index, match in matcher.search(text).items():
+                    plugin, trigger = triggers[index]
+                    matches.append((plugin, trigger, match))
+            else:
+                if ignore_case and lowered is None:
+                    lowered = text.lower()
+
+                for index in matcher.search(lowered if ignore_case else text):
+                    plugin, trigger = triggers[index]
+                    matches.append((plugin, trigger, trigger.pattern))
+
+        return matches
@@ -19,14 +19,24 @@
 # SOFTWARE.
 
 import asyncio
+import heapq
 import importlib.util
+import itertools
+import json
+import logging
 import os
+import time
+from collections import OrderedDict, deque
 from math import ceil as _ceil
 
 import discord
 
+from detache.command import scopes
+
 ceil = lambda x: int(_ceil(x))
 
+default_log = logging.getLogger("outlet")
+
 
 def import_file(path):
     try:
@@ -52,20 +62,333 @@ async def wait_then(s, coroutine):
     return await coroutine
 
 
+class Session(object):
+    """
+    Interactive session opened with :meth:`SessionManager.open`.
+    """
+
+    __slots__ = ["message_id", "handler", "on_timeout", "timeout", "deadline", "lock", "closed"]
+
+    def __init__(self, message_id, handler, on_timeout, timeout, deadline):
+        self.message_id = message_id
+
+        self.handler = handler
+        self.on_timeout = on_timeout
+
+        self.timeout = timeout
+        self.deadline = deadline
+
+        self.lock = asyncio.Lock()  # reactions are handled one at a time per session
+        self.closed = False
+
+
+class SessionManager(object):
+    """
+    Routes reactions to interactive sessions, such as :class:`PagedEmbed`, by message ID.
+
+    Each reaction is a single dict lookup no matter how many sessions are open, and session timeouts share one timer.
+    :class:`detache.Bot` has one at :attr:`Bot.sessions`.
+    """
+
+    def __init__(self):
+        self._sessions = {}  # message id -> Session
+
+        # heap of (deadline, n, session). sessions whose deadline moved are pushed back when popped
+        self._deadlines = []
+        self._counter = itertools.count()  # breaks ties between equal deadlines
+
+        self._timer = None
+        self._timer_at = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, message_id):
+        return message_id in self._sessions
+
+    def open(self, message, handler, *, timeout, on_timeout=None):
+        """
+        Opens a session on a message.
+
+        :param discord.Message message: Message to route reactions from.
+        :param handler: Coroutine function called with (reaction, user) for every reaction added to the message.
+        :param float timeout: (Keyword) Seconds without a reaction before the session times out.
+        :param on_timeout: (Keyword) (Optional) Coroutine function called with no arguments when the session times out.
+        :returns: :class:`Session`
+        """
+
+        if message.id in self._sessions:
+            self.close(message.id)
+
+        loop = asyncio.get_event_loop()
+
+        session = Session(message.id, handler, on_timeout, timeout, loop.time() + timeout)
+
+        self._sessions[message.id] = session
+        self._push(session)
+
+        return session
+
+    def close(self, message_id):
+        """
+        Closes a session without calling its timeout callback.
+
+        :param int message_id: ID of the session's message.
+        """
+
+        session = self._sessions.pop(message_id, None)
+
+        if session is not None:
+            session.closed = True
+
+    async def dispatch(self, reaction, user):
+        """
+        Passes a reaction to the session on its message, if there is one.
+
+        :returns: True if the reaction was handled by a session.
+        """
+
+        session = self._sessions.get(reaction.message.id)
+
+        if session is None:
+            return False
+
+        session.deadline = asyncio.get_event_loop().time() + session.timeout
+
+        async with session.lock:
+            if not session.closed:
+                await session.handler(reaction, user)
+
+        return True
+
+    def _push(self, session):
+        heapq.heappush(self._deadlines, (session.deadline, next(self._counter), session))
+
+        if self._timer_at is None or session.deadline < self._timer_at:
+            self._schedule(session.deadline)
+
+    def _schedule(self, when):
+        if self._timer is not None:
+            self._timer.cancel()
+
+        self._timer = asyncio.get_event_loop().call_at(when, self._expire)
+        self._timer_at = when
+
+    def _expire(self):
+        self._timer = None
+        self._timer_at = None
+
+        now = asyncio.get_event_loop().time()
+
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, session = heapq.heappop(self._deadlines)
+
+            if session.closed:
+                continue
+
+            if session.deadline > now:  # a reaction moved the deadline
+                heapq.heappush(self._deadlines, (session.deadline, next(self._counter), session))
+                continue
+
+            self.close(session.message_id)
+
+            if session.on_timeout is not None:
+                asyncio.ensure_future(session.on_timeout())
+
+        if self._deadlines:
+            self._schedule(self._deadlines[0][0])
+
+
+class _Window(object):
+    __slots__ = ["counts", "last", "total"]
+
+    def __init__(self, buckets, bucket):
+        self.counts = [0] * buckets
+        self.last = bucket  # bucket number of the latest hit
+        self.total = 0
+
+
+class SlidingWindow(object):
+    """
+    Counts hits per key, such as a user ID, over the last ``window`` seconds. Made for anti-spam checks like "5 messages
+    in 10 seconds". ::
+
+        spam = detache.util.SlidingWindow(10)
+
+        bot.checks.add(spam.check(5, "user"), "spam")
+
+    The window is split into buckets, so each key is a fixed size counter no matter how many hits it gets, and hits
+    are counted to the nearest bucket. Recording and counting are O(1). Keys are evicted once they've been idle for a
+    whole window, or least recently used first once there are ``max_keys``.
+
+    :param float window: Seconds to count hits over.
+    :param int buckets: (Optional) Buckets the window is split into. Defaults to 10.
+    :param int max_keys: (Optional) Most keys kept. Defaults to 100000.
+    """
+
+    def __init__(self, window, buckets=10, max_keys=100000):
+        if buckets < 1:
+            raise ValueError("buckets must be at least 1")
+
+        self.window = window
+        self.buckets = buckets
+        self.max_keys = max_keys
+
+        self._width = window / buckets
+        self._keys = OrderedDict()  # key -> _Window, least recently hit first
+
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _bucket(self, now):
+        return int((time.monotonic() if now is None else now) / self._width)
+
+    def _advance(self, window, bucket):
+        # zero the buckets that fell out of the window since the last hit
+        if bucket - window.last >= self.buckets:
+            window.counts = [0] * self.buckets
+            window.total = 0
+        else:
+            counts = window.counts
+            for n in range(window.last + 1, bucket + 1):
+                index = n % self.buckets
+
+                window.total -= counts[index]
+                counts[index] = 0
+
+        window.last = bucket
+
+    def hit(self, key, n=1, now=None):
+        """
+        Records hits for a key.
+
+        :param key: Key to count hits for.
+        :param int n: (Optional) Number of hits. Defaults to 1.
+        :returns: Hits in the window, including these.
+        """
+
+        bucket = self._bucket(now)
+        keys = self._keys
+
+        window = keys.get(key)
+
+        if window is None:
+            window = keys[key] = _Window(self.buckets, bucket)
+            self._evict(bucket)
+        else:
+            if bucket > window.last:
+                self._advance(window, bucket)
+
+            keys.move_to_end(key)
+
+        window.counts[bucket % self.buckets] += n
+        window.total += n
+
+        return window.total
+
+    def count(self, key, now=None):
+        """
+        Returns hits for a key in the window, without recording one.
+        """
+
+        window = self._keys.get(key)
+
+        if window is None:
+            return 0
+
+        bucket = self._bucket(now)
+
+        if bucket > window.last:
+            self._advance(window, bucket)
+
+        return window.total
+
+    def reset(self, key):
+        """Forgets a key's hits."""
+
+        self._keys.pop(key, None)
+
+    def clear(self):
+        """Forgets every key."""
+
+        self._keys.clear()
+
+    def _evict(self, bucket):
+        keys = self._keys
+
+        while len(keys) > self.max_keys:
+            keys.popitem(last=False)
+            self.evicted += 1
+
+        # keys are in the order they were last hit, so idle keys are all at the front
+        while keys:
+            window = next(iter(keys.values()))
+
+            if bucket - window.last < self.buckets:
+                break
+
+            keys.popitem(last=False)
+
+    def check(self, limit, scope="user"):
+        """
+        Returns a check that records a hit and passes while the scope has at most limit hits in the window. Works as a
+        global check in :attr:`detache.Bot.checks`, or a command check.
+
+        :param int limit: Most hits allowed in the window.
+        :param str scope: (Optional) One of "user", "channel" or "guild". Defaults to "user".
+        """
+
+        key = scopes[scope]
+
+        def check(obj):  # message or Context, both have author, channel and guild
+            id_ = key(obj)
+
+            return id_ is None or self.hit(id_) <= limit  # guild scope doesn't limit DMs
+
+        return check
+
+    def metrics(self):
+        """Returns a dict of the number of keys and keys evicted by max_keys."""
+
+        return {"keys": len(self._keys), "evicted": self.evicted}
+
+
+def _field(field):
+    # (name, value, inline) from an embed field or a (name, value[, inline]) tuple
+    if isinstance(field, tuple):
+        return field if len(field) == 3 else (field[0], field[1], False)
+
+    return field.name, field.value, False
+
+
 class PagedEmbed(object):
     """
     Utility class used to create paged embeds, which use reactions to go to other pages.
 
-    :param discord.Embed embed: Embed to page. You should create your embed beforehand, this class
-                                will simply paginate it.
+    Pages are rendered when they're shown, and the most recently shown pages are kept in a small cache.
+
     :param discord.Client client: Discord client to use when sending the paged embed.
+    :param discord.Embed embed: Embed to page. You should create your embed beforehand, this class
+                                will simply paginate it. If source is passed, the embed's fields are ignored and it's
+                                only used for the title, description, author and footer.
     :param int per_page: (Keyword) Number of fields to show per page. Must be <= 25
+    :param source: (Keyword) (Optional) Where to get fields from, instead of the embed. Can be a list of fields,
+                   an async iterator of fields, or a coroutine function that takes a page number and the number of
+                   fields per page and returns the fields on that page (an empty list if the page doesn't exist).
+                   Fields can be embed fields or (name, value) tuples.
+    :param int page_count: (Keyword) (Optional) Number of pages, if source is a coroutine function.
+    :param int cache_size: (Keyword) Number of rendered pages to keep.
     """
 
-    __slots__ = ["_client", "_embed", "per_page", "author", "title", "description", "fields", "footer",
-                 "pages", "current_page"]
+    __slots__ = ["_client", "_embed", "per_page", "author", "title", "description", "footer", "current_page",
+                 "_source", "_from_embed", "_fetch", "_iterator", "_buffer", "_page_count", "_cache", "_cache_size"]
 
-    def __init__(self, client, embed, *, per_page=10):
+    def __init__(self, client, embed, *, per_page=10, source=None, page_count=None, cache_size=8):
         if not 1 <= per_page <= 25:
             raise ValueError("fields per page must be in range [1, 25]")
 
@@ -79,55 +402,170 @@ class PagedEmbed(object):
         self.title = embed.title
         self.description = embed.description
 
-        self.fields = embed.fields
-
         self.footer = embed.footer
 
-        self.pages = self.make_pages()
+        self._source = None  # list of fields
+        self._fetch = None  # page-fetch coroutine function
+        self._iterator = None  # async iterator of fields, buffered as pages are read
+        self._buffer = None
 
-        self.current_page = 0
+        self._page_count = page_count
+
+        self._from_embed = source is None  # fields come from the embed itself
 
-    def make_pages(self):
-        if len(self.fields) < self.per_page:
-            return [self._embed]
+        if source is None:
+            self._source = embed.fields
+        elif hasattr(source, "__aiter__"):
+            self._iterator = source.__aiter__()
+            self._buffer = []
+        elif callable(source):
+            self._fetch = source
         else:
-            n_pages = ceil(len(self.fields) / self.per_page)
+            self._source = list(source)
+
+        if self._source is not None:
+            self._page_count = max(1, ceil(len(self._source) / self.per_page))
+
+        self._cache = OrderedDict()  # page number -> rendered embed, least recently used first
+        self._cache_size = cache_size
+
+        self.current_page = 0
+
+    @property
+    def page_count(self):
+        """Number of pages, or None if it isn't known yet."""
+
+        return self._page_count
+
+    async def _read(self, end):
+        # read the iterator until the buffer has end fields, or it runs out
+
+        while len(self._buffer) < end:
+            try:
+                self._buffer.append(await self._iterator.__anext__())
+            except StopAsyncIteration:
+                self._iterator = None
+                self._page_count = max(1, ceil(len(self._buffer) / self.per_page))
+
+                break
+
+    async def page_fields(self, page):
+        """
+        Returns the fields on a page.
+
+        :param int page: Page number, starting at 0.
+        """
+
+        start = page * self.per_page
+        end = start + self.per_page
+
+        if self._source is not None:
+            return self._source[start:end]
+
+        if self._fetch is not None:
+            return list(await self._fetch(page, self.per_page) or [])
 
-            embeds = []
-            for page in range(n_pages):
-                this_page = self.fields[:self.per_page]
+        if self._iterator is not None:
+            await self._read(end)
 
-                page_embed = discord.Embed(title=self.title, description=self.description)
+        return self._buffer[start:end]
 
-                if self.author.name is not discord.Embed.Empty:
-                    page_embed.set_author(**self.author)
+    def render(self, page, fields):
+        """
+        Creates the embed for a page.
+
+        :param int page: Page number, starting at 0.
+        :param fields: Fields on the page.
+        """
+
+        if self._from_embed and self._page_count == 1:  # fits on one page, use it as is
+            return self._embed
+
+        page_embed = discord.Embed(title=self.title, description=self.description)
 
-                footer_text = self.footer.text + " | " if self.footer.text is not discord.Embed.Empty else ""
-                page_embed.set_footer(text=footer_text + "Page {}/{}".format(page + 1, n_pages),
-                                      icon_url=self.footer.icon_url)
+        if self.author.name is not discord.Embed.Empty:
+            page_embed.set_author(**self.author)
 
-                for field in this_page:
-                    page_embed.add_field(name=field.name, value=field.value, inline=False)
+        page_number = "Page {}".format(page + 1)
+        if self._page_count is not None:
+            page_number += "/{}".format(self._page_count)
 
-                embeds.append(page_embed)
+        footer_text = self.footer.text + " | " if self.footer.text is not discord.Embed.Empty else ""
+        page_embed.set_footer(text=footer_text + page_number, icon_url=self.footer.icon_url)
 
-                del self.fields[:self.per_page]
+        for field in fields:
+            name, value, inline = _field(field)
 
-            return embeds
+            page_embed.add_field(name=name, value=value, inline=inline)
+
+        return page_embed
+
+    async def get_page(self, page):
+        """
+        Returns the embed for a page, or None if the page doesn't exist.
+
+        :param int page: Page number, starting at 0.
+        """
+
+        if page < 0 or (self._page_count is not None and page >= self._page_count):
+            return None
+
+        embed = self._cache.get(page)
+
+        if embed is not None:
+            self._cache.move_to_end(page)
+            return embed
+
+        fields = await self.page_fields(page)
+
+        if not fields and page > 0:  # past the end of a source without a known length
+            return None
+
+        embed = self._cache[page] = self.render(page, fields)
+
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+        return embed
+
+    async def goto_page(self, message, page):
+        """
+        Shows a page. Does nothing if the page doesn't exist.
+
+        :param discord.Message message: Message the paged embed is in.
+        :param int page: Page number, starting at 0.
+        """
+
+        if page == self.current_page:
+            return
+
+        embed = await self.get_page(page)
+
+        if embed is not None:
+            self.current_page = page
+            await message.edit(embed=embed)
 
     async def next_page(self, message):
-        if self.current_page < len(self.pages):
-            self.current_page += 1
-            await message.edit(embed=self.pages[self.current_page])
+        await self.goto_page(message, self.current_page + 1)
 
     async def previous_page(self, message):
-        if self.current_page > 0:
-            self.current_page -= 1
-            await message.edit(embed=self.pages[self.current_page])
+        await self.goto_page(message, self.current_page - 1)
+
+    async def first_page(self, message):
+        await self.goto_page(message, 0)
+
+    async def last_page(self, message):
+        if self._iterator is not None:  # the end isn't known until the iterator runs out
+            await self._read(float("inf"))
+
+        if self._page_count is not None:
+            await self.goto_page(message, self._page_count - 1)
 
     reactions = {
+        "⏮": first_page,
         "⬅": previous_page,
         "➡": next_page,
+        "⏭": last_page,
     }
 
     async def run(self, channel, user_for, *, timeout=120):
@@ -147,11 +585,40 @@ class PagedEmbed(object):
 
             return True
 
-        message = await channel.send(embed=self.pages[self.current_page])
+        message = await channel.send(embed=await self.get_page(self.current_page))
 
         for emoji in self.reactions:
             await message.add_reaction(emoji)
 
+        sessions = getattr(self._client, "sessions", None)
+
+        if isinstance(sessions, SessionManager):
+            # route reactions through the client's session manager instead of a wait_for check per paged embed
+            done = asyncio.get_event_loop().create_future()
+
+            async def handle(reaction, user):
+                if not check(reaction, user):
+                    return
+
+                # remove the reaction while the page changes
+                removing = asyncio.ensure_future(message.remove_reaction(reaction, user))
+
+                if user == user_for:
+                    await self.reactions[str(reaction.emoji)](self, message)
+
+                await removing
+
+            async def expire():
+                try:
+                    await message.clear_reactions()
+                finally:
+                    done.set_result(None)
+
+            sessions.open(message, handle, timeout=timeout, on_timeout=expire)
+
+            await done
+            return
+
         while True:
             try:
                 reaction, user = await self._client.wait_for("reaction_add", check=check, timeout=timeout)
@@ -164,3 +631,291 @@ class PagedEmbed(object):
             except asyncio.TimeoutError:
                 await message.clear_reactions()
                 break
+
+
+class JSONFile(object):
+    """
+    JSON file that's written to a temporary file first, then renamed over the old one, so a crash while writing never
+    leaves half a file.
+
+    :param str path: Path to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._lock = None  # made on first save, so it's made on the running loop
+
+    def read(self, default=None):
+        """Returns what's in the file, or default if it doesn't exist or can't be read."""
+
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):  # not saved yet, or partly written by something else
+            return default
+
+    def write(self, data):
+        """Writes data to the file."""
+
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(data, file)
+
+        os.replace(self.path + ".tmp", self.path)
+
+    def remove(self):
+        """Removes the file, if it exists."""
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def save(self, data):
+        """
+        Coroutine
+
+        Writes data to the file in an executor. Saves run one at a time, in the order they were called, so the file
+        always ends up with the newest data.
+        """
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            await asyncio.get_event_loop().run_in_executor(None, self.write, data)
+
+
+class TokenBucket(object):
+    """
+    Rate budget shared by many tasks. Tokens refill at rate per second, up to burst.
+
+    :param float rate: Tokens added per second. None for no limit, so only :meth:`pause` makes tasks wait.
+    :param int burst: (Optional) Most tokens saved up. Defaults to rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate or 1)
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+        self._paused_until = 0.0
+
+        self._lock = asyncio.Lock()  # waiters are served in order
+
+    def _refill(self):
+        now = time.monotonic()
+
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Stops handing out tokens for a number of seconds, i.e. after hitting a global rate limit."""
+
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens=1):
+        """
+        Coroutine
+
+        Waits until there are enough tokens, then takes them.
+        """
+
+        async with self._lock:
+            while True:
+                paused = self._paused_until - time.monotonic()
+
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue  # could have been paused again
+
+                if self.rate is None:
+                    return
+
+                self._refill()
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class Checkpoint(object):
+    """
+    Progress of a long job, saved in a JSON file so the job can carry on where it stopped if it's interrupted. Used by
+    :func:`detache.bulk.run` and :class:`HistoryScanner`.
+
+    Nothing is read until :meth:`load` is called.
+
+    :param str path: Path to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        #: JSON serializable progress. Keys of dicts are strings once saved
+        self.data = {}
+
+        self._file = JSONFile(path)
+
+    def load(self):
+        """Reads the file into :attr:`data` and returns it. Empty if the file doesn't exist."""
+
+        self.data = self._file.read({})
+
+        return self.data
+
+    def save(self):
+        """Writes :attr:`data` to the file."""
+
+        self._file.write(self.data)
+
+    def remove(self):
+        """Removes the file, i.e. when the job is done."""
+
+        self._file.remove()
+
+
+class HistoryScanner(object):
+    """
+    Scans the message history of many channels at once, oldest messages first, in batches. ::
+
+        scanner = detache.util.HistoryScanner(guild.text_channels, checkpoint="archive.json")
+
+        async for channel, messages in scanner.scan():
+            await archive(channel, messages)
+
+    After each batch is handled, the channel's last message is saved in the checkpoint, so a scan that was
+    interrupted, or that runs again later, only gets messages it hasn't seen. The checkpoint is loaded when the scan
+    starts.
+
+    :param channels: Iterable of channels to scan.
+    :param checkpoint: (Optional) Path of a :class:`Checkpoint` file, or a :class:`Checkpoint`.
+    :param int concurrency: (Optional) Channels scanned at once. Defaults to 5.
+    :param float rate: (Optional) History requests per second, shared by every channel. Defaults to 5.
+    :param int batch_size: (Optional) Most messages in a batch. Defaults to 100.
+    :param bool full: (Optional) If True, scans from the start of each channel, ignoring the checkpoint.
+    :param logger: (Optional) Logging object.
+    """
+
+    def __init__(self, channels, checkpoint=None, *, concurrency=5, rate=5, batch_size=100, full=False,
+                 logger=default_log):
+        self.channels = list(channels)
+
+        if isinstance(checkpoint, str):
+            checkpoint = Checkpoint(checkpoint)
+        self.checkpoint = checkpoint  # data is {channel id: last message id scanned}
+
+        self.concurrency = concurrency
+        self.budget = TokenBucket(rate)
+        self.batch_size = batch_size
+        self.full = full
+
+        self.log = logger
+
+        #: channel id -> exception, for channels that couldn't be scanned
+        self.errors = {}
+
+        self.scanned = 0
+
+    def _start(self, channel):
+        if self.full or self.checkpoint is None:
+            return 0
+
+        return self.checkpoint.data.get(str(channel.id)) or 0
+
+    async def _scan_channel(self, channel, batches):
+        history = channel.history(limit=None, after=discord.Object(id=self._start(channel)), oldest_first=True)
+
+        batch = []
+        count = 0
+
+        while True:
+            if count % 100 == 0:  # discord.py fetches 100 messages per request
+                await self.budget.acquire()
+
+            try:
+                message = await history.next()
+            except discord.NoMoreItems:
+                break
+
+            count += 1
+            batch.append(message)
+
+            if len(batch) >= self.batch_size:
+                await batches.put((channel, batch))
+                batch = []
+
+        if batch:
+            await batches.put((channel, batch))
+
+    async def _work(self, channels, batches):
+        while channels:
+            channel = channels.popleft()
+
+            try:
+                await self._scan_channel(channel, batches)
+            except discord.HTTPException as e:  # i.e. no permission to read history
+                self.errors[channel.id] = e
+                self.log.warning("couldn't scan history of %r: %s", channel, e)
+
+    async def scan(self):
+        """
+        Async generator of (channel, [messages]) batches. Batches from one channel are in order, but batches from
+        different channels are mixed.
+
+        If the loop stops early, the checkpoint is saved when the generator is closed.
+        """
+
+        if self.checkpoint is not None:
+            self.checkpoint.load()
+
+        channels = deque(self.channels)
+        batches = asyncio.Queue(maxsize=self.concurrency * 2)  # scanning waits for batches to be handled
+
+        workers = [asyncio.ensure_future(self._work(channels, batches)) for _ in range(self.concurrency)]
+        finished = asyncio.ensure_future(asyncio.gather(*workers))
+        finished.add_done_callback(lambda future: future.cancelled() or future.exception())  # retrieved when closed
+
+        last_saved = time.monotonic()
+
+        try:
+            while True:
+                if batches.empty():
+                    if finished.done():  # every channel was scanned
+                        finished.result()  # raises if a worker failed
+                        break
+
+                    get = asyncio.ensure_future(batches.get())
+                    await asyncio.wait([get, finished], return_when=asyncio.FIRST_COMPLETED)
+
+                    if not get.done():
+                        get.cancel()
+                        continue
+
+                    channel, batch = get.result()
+                else:
+                    channel, batch = batches.get_nowait()
+
+                yield channel, batch
+
+                # the batch was handled
+                self.scanned += len(batch)
+
+                if self.checkpoint is not None:
+                    self.checkpoint.data[str(channel.id)] = batch[-1].id
+
+                    if time.monotonic() - last_saved > 1:
+                        self.checkpoint.save()
+                        last_saved = time.monotonic()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            finished.cancel()
+
+            if self.checkpoint is not None:
+                self.checkpoint.save()
+
@@ -18,21 +18,58 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+
 
 # used for detection by plugin
 class EventListenerInherit:
     pass
 
 
-def event_listener(event, one_task=False):
+# state for a burst of events that share a coalescing key
+class _Burst(object):
+    __slots__ = ["plugin", "args", "kwargs", "deadline", "dirty", "task"]
+
+    def __init__(self, plugin, args, kwargs, deadline):
+        self.plugin = plugin
+        self.args = args
+        self.kwargs = kwargs
+
+        self.deadline = deadline  # debounce deadline, in loop time
+        self.dirty = True  # True if an event arrived that hasn't been handled yet
+
+        self.task = None
+
+
+def event_listener(event, one_task=False, debounce=None, throttle=None, coalesce_by=None, ordered=False):
     """
     Event listener decorator. Calls function every time the given event occurs, with the respective arguments.
 
     :param event: Event to listen for.
     :param bool one_task: (Optional) If True, this will check if the event listener is already running when it's called.
                           If so, the running task is cancelled.
+    :param float debounce: (Optional) Wait until no events have arrived for this many seconds, then call the function
+                           once with the latest arguments.
+    :param float throttle: (Optional) Call the function at most once every this many seconds. Events that arrive in
+                           between are merged into one call with the latest arguments.
+    :param coalesce_by: (Optional) Function that takes the event arguments and returns a key. Bursts of events are
+                        merged per key, so events with different keys never replace each other. If used without
+                        debounce or throttle, events that arrive while the function is running for the same key are
+                        merged into one follow-up call.
+    :param bool ordered: (Optional) If True, events are handled one at a time per guild, in the order they arrived. See
+                         :class:`detache.plugin.GuildLanes`.
+
+    If any of debounce, throttle or coalesce_by are used, one_task is ignored. For example, to handle role changes
+    at most once every 5 seconds per member: ::
+
+        @detache.event_listener("on_member_update", throttle=5, coalesce_by=lambda before, after: after.id)
+        async def roles_changed(self, before, after):
+            ...
     """
 
+    if ordered and (debounce is not None or throttle is not None or coalesce_by is not None):
+        raise ValueError("ordered event listeners can't be debounced, throttled or coalesced")
+
     # class wraps the callback function
     # class is detected by plugin and plugin triggers the event listener
     class EventListener(EventListenerInherit):
@@ -41,14 +78,100 @@ def event_listener(event, one_task=False):
             self.event = event
 
             self.one_task = one_task
+            self.ordered = ordered
+
+            self.debounce = debounce
+            self.throttle = throttle
+            self.coalesce_by = coalesce_by
+
+            self.coalesces = debounce is not None or throttle is not None or coalesce_by is not None
 
             self.task = None
+            self.bursts = {}  # coalescing key -> _Burst
+
+            #: number of events received, and number of times the function was actually called
+            self.received = 0
+            self.executed = 0
+
+        async def execute(self, plugin, *args, **kwargs):
+            self.received += 1
+
+            if self.coalesces:
+                return self.merge(plugin, args, kwargs)
+
+            if self.one_task:
+                self.cancel()
+
+            self.task = asyncio.ensure_future(self.call(plugin, args, kwargs))
+
+            try:
+                await self.task
+            except asyncio.CancelledError:  # replaced by a newer event
+                pass
+
+        async def call(self, plugin, args, kwargs):
+            self.executed += 1
+
+            await plugin.timed(self.func(plugin, *args, **kwargs), "event_listener", self.func.__name__)
+
+        def merge(self, plugin, args, kwargs):
+            key = self.coalesce_by(*args, **kwargs) if self.coalesce_by is not None else None
+
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + (self.debounce or 0)
+
+            burst = self.bursts.get(key)
+
+            if burst is None:
+                burst = self.bursts[key] = _Burst(plugin, args, kwargs, deadline)
+                burst.task = asyncio.ensure_future(self.drain(key, burst))
+            else:
+                # merge into the pending burst, the newest arguments win
+                burst.plugin = plugin
+                burst.args = args
+                burst.kwargs = kwargs
+
+                burst.deadline = deadline
+                burst.dirty = True
+
+        async def drain(self, key, burst):
+            # runs the function for a burst until no new events arrive for its key
+
+            loop = asyncio.get_event_loop()
+
+            try:
+                while burst.dirty:
+                    # wait for the burst to go quiet
+                    delay = burst.deadline - loop.time()
+                    while delay > 0:
+                        await asyncio.sleep(delay)
+                        delay = burst.deadline - loop.time()
+
+                    burst.dirty = False
+                    started = loop.time()
+
+                    try:
+                        await self.call(burst.plugin, burst.args, burst.kwargs)
+                    except Exception:  # log it and keep draining, events merged meanwhile still get a call
+                        burst.plugin.log.exception("error in event listener %s", self.func.__name__)
+
+                    if self.throttle is not None:
+                        # keep the key open for the rest of the window, so events in it are merged
+                        remaining = started + self.throttle - loop.time()
+                        if remaining > 0:
+                            await asyncio.sleep(remaining)
+            finally:
+                if self.bursts.get(key) is burst:
+                    del self.bursts[key]
+
+        def cancel(self):
+            """Cancels the running task, and any pending merged calls."""
 
-        async def execute(self, *args, **kwargs):
-            if self.one_task and self.task is not None and not self.task.done():  # check if old task still runnning
+            if self.task is not None and not self.task.done():
                 self.task.cancel()
 
-            self.task = await self.func(*args, **kwargs)
+            for burst in list(self.bursts.values()):
+                burst.task.cancel()
 
     return EventListener
 
@@ -74,10 +197,14 @@ def background_task(id):
             self.task = None
 
         def start(self, loop, self_):
-            self.task = loop.create_task(self.func(self_))
+            self.task = loop.create_task(self_.timed(self.func(self_), "background_task", self.id))
+
+        @property
+        def running(self):
+            return self.task is not None and not self.task.done()
 
         def cancel(self):
-            if self.task is not None and not self.task.done():
+            if self.running:
                 self.task.cancel()
 
         def restart(self, loop, self_):
@@ -85,3 +212,68 @@ def background_task(id):
             self.start(loop, self_)
 
     return BgTask
+
+
+# used for detection by plugin
+class CheckInherit:
+    __slots__ = []
+
+
+class Check(CheckInherit):
+    __slots__ = ["func"]
+
+    def __init__(self, func):
+        self.func = func
+
+
+def check(func):
+    """
+    Plugin check decorator. The function is called with the command context before any of the plugin's commands run,
+    and the command is stopped unless it returns a truthy value. Can be used on functions or coroutines. ::
+
+        @detache.check
+        def not_muted(self, ctx):
+            return ctx.channel.id not in self.muted_channels
+    """
+
+    return Check(func)
+
+
+# used for detection by plugin
+class TriggerInherit:
+    __slots__ = []
+
+
+class Trigger(TriggerInherit):
+    __slots__ = ["func", "pattern", "regex", "ignore_case"]
+
+    def __init__(self, func, pattern, regex, ignore_case):
+        self.func = func
+
+        self.pattern = pattern
+        self.regex = regex
+        self.ignore_case = ignore_case
+
+
+def trigger(pattern, regex=False, ignore_case=True):
+    """
+    Trigger decorator. Calls the function with the message and the match whenever a message contains the pattern. ::
+
+        @detache.trigger("good bot")
+        async def thanks(self, message, match):
+            await message.add_reaction("❤")
+
+    Instead of every plugin searching every message, the bot searches each message once for all triggers.
+
+    :param str pattern: Keyword to look for anywhere in a message, or a regex if regex is True.
+    :param bool regex: (Optional) If True, pattern is a regex and the function gets its re.Match.
+    :param bool ignore_case: (Optional) Whether case is ignored. Defaults to True.
+    """
+
+    if not pattern:
+        raise ValueError("trigger pattern can't be empty")
+
+    def decorator(func):
+        return Trigger(func, pattern, regex, ignore_case)
+
+    return decorator
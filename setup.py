@@ -45,6 +45,6 @@ setup(
     long_description=long_desc,
     license="MIT",
     packages=["detache"],
-    requirements=requirements,
+    install_requires=requirements,
     url="http://github.com/reshanie/detache",
 )
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import discord
+from aiohttp import web
+
+from detache import bulk
+
+
+def snowflake(seconds_ago):
+    return int((time.time() - seconds_ago) * 1000 - discord.utils.DISCORD_EPOCH) << 22
+
+
+class FakeAPI(object):
+    # local REST server. responses[item id] is a list of (status, headers) returned before the item succeeds
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+
+        self.calls = []  # (item id, time)
+        self.bulk_deleted = []  # lists of message ids
+        self.deleted = []  # message ids
+
+        self.url = None
+        self.session = None
+
+    async def item(self, request):
+        item_id = int(request.match_info["id"])
+        self.calls.append((item_id, time.monotonic()))
+
+        responses = self.responses.get(item_id)
+        if responses:
+            status, headers = responses.pop(0)
+
+            return web.json_response({"message": "nope", "code": 0}, status=status, headers=headers)
+
+        return web.json_response({"id": item_id})
+
+    async def bulk_delete(self, request):
+        self.bulk_deleted.append((await request.json())["messages"])
+
+        return web.Response(status=204)
+
+    async def delete(self, request):
+        self.deleted.append(int(request.match_info["id"]))
+
+        return web.Response(status=204)
+
+    async def request(self, method, path, **kwargs):
+        async with self.session.request(method, self.url + path, **kwargs) as response:
+            data = await response.json() if response.content_type == "application/json" else None
+
+            if response.status >= 400:
+                raise discord.HTTPException(response, data)
+
+            return data
+
+    def edit(self, item):
+        return self.request("POST", "/items/{}".format(item))
+
+
+class Channel(object):
+    def __init__(self, api):
+        self.id = 1
+        self.api = api
+
+    async def delete_messages(self, messages):
+        await self.api.request("POST", "/channels/1/messages/bulk-delete",
+                               json={"messages": [message.id for message in messages]})
+
+
+class Message(object):
+    def __init__(self, api, id):
+        self.api = api
+        self.id = id
+
+    async def delete(self):
+        await self.api.request("DELETE", "/channels/1/messages/{}".format(self.id))
+
+
+def serve(api, test):
+    async def main():
+        app = web.Application()
+        app.router.add_post("/items/{id}", api.item)
+        app.router.add_post("/channels/1/messages/bulk-delete", api.bulk_delete)
+        app.router.add_delete("/channels/1/messages/{id}", api.delete)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+
+        api.url = "http://127.0.0.1:{}".format(site._server.sockets[0].getsockname()[1])
+        api.session = aiohttp.ClientSession()
+
+        try:
+            return await test()
+        finally:
+            await api.session.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_runs_every_item():
+    api = FakeAPI()
+
+    result = serve(api, lambda: bulk.run(range(20), api.edit, rate=None))
+
+    assert [r.value for r in result] == [{"id": i} for i in range(20)]
+    assert len(result.succeeded) == 20
+
+
+def test_retries_after_rate_limit():
+    api = FakeAPI({3: [(429, {"Retry-After": "0.2"})], 5: [(500, {})]})
+
+    result = serve(api, lambda: bulk.run(range(10), api.edit, rate=None, backoff=0.01))
+
+    assert len(result.succeeded) == 10
+    assert result.results[3].attempts == result.results[5].attempts == 2
+
+    calls = [at for item, at in api.calls if item == 3]
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_gives_up_after_retries():
+    api = FakeAPI({1: [(429, {"Retry-After": "0.01"})] * 10, 2: [(403, {})]})
+
+    result = serve(api, lambda: bulk.run(range(4), api.edit, rate=None, retries=2))
+
+    assert [r.item for r in result.failed] == [1, 2]
+    assert result.results[1].attempts == 3
+    assert result.results[2].attempts == 1  # forbidden isn't retried
+    assert result.results[2].error.status == 403
+
+
+def test_global_rate_limit_pauses_every_item():
+    api = FakeAPI({0: [(429, {"Retry-After": "0.3", "X-RateLimit-Global": "true"})]})
+
+    async def test():
+        start = time.monotonic()
+        result = await bulk.run(range(5), api.edit, concurrency=1, rate=100)
+
+        return start, result
+
+    start, result = serve(api, test)
+
+    assert len(result.succeeded) == 5
+    assert all(at - start >= 0.3 for item, at in api.calls[1:])
+
+
+def test_checkpoint_resumes(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    api = FakeAPI({7: [(403, {})]})
+
+    first = serve(api, lambda: bulk.run(range(10), api.edit, rate=None, checkpoint=path))
+
+    assert [r.item for r in first.failed] == [7]
+    assert os.path.exists(path)
+
+    api.calls.clear()
+    second = serve(api, lambda: bulk.run(range(10), api.edit, rate=None, checkpoint=path))
+
+    assert [item for item, at in api.calls] == [7]
+    assert len(second.skipped) == 9 and len(second.succeeded) == 1
+    assert not os.path.exists(path)  # removed once every item is done
+
+
+def test_checkpoint_saved_when_interrupted(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    api = FakeAPI()
+
+    async def edit(item):
+        if item == 5:
+            await asyncio.sleep(60)
+
+        return await api.edit(item)
+
+    async def interrupted():
+        try:
+            await asyncio.wait_for(bulk.run(range(10), edit, rate=None, concurrency=1, checkpoint=path), 1)
+        except asyncio.TimeoutError:
+            pass
+
+    serve(api, interrupted)
+
+    with open(path) as file:
+        assert json.load(file)
+
+    api.calls.clear()
+    result = serve(api, lambda: bulk.run(range(10), api.edit, rate=None, checkpoint=path))
+
+    assert [item for item, at in api.calls] == [5, 6, 7, 8, 9]
+    assert len(result.skipped) == 5
+
+
+def test_bulk_delete_splits_recent_and_old_messages():
+    api = FakeAPI()
+    channel = Channel(api)
+
+    day = 24 * 60 * 60
+    recent = [Message(api, snowflake(day) + i) for i in range(150)]
+    old = [Message(api, snowflake(20 * day) + i) for i in range(3)]
+
+    result = serve(api, lambda: bulk.bulk_delete(channel, recent + old, rate=None))
+
+    assert len(result) == 153 and len(result.succeeded) == 153
+    assert [len(ids) for ids in api.bulk_deleted] == [100, 50]
+    assert sorted(api.deleted) == sorted(message.id for message in old)
+
+
+def test_bulk_delete_treats_messages_near_cutoff_as_old():
+    api = FakeAPI()
+    channel = Channel(api)
+
+    # a minute before the 14 day limit is too close, it could pass the limit before it's deleted
+    messages = [Message(api, snowflake(14 * 24 * 60 * 60 - 60)), Message(api, snowflake(60)),
+                Message(api, snowflake(30))]
+
+    serve(api, lambda: bulk.bulk_delete(channel, messages, rate=None))
+
+    assert api.deleted == [messages[0].id]
+    assert api.bulk_deleted == [[messages[1].id, messages[2].id]]
@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+
+from detache import CommandCache
+
+
+class Guild(object):
+    def __init__(self, id):
+        self.id = id
+
+
+class Context(object):
+    def __init__(self, guild_id):
+        self.guild = Guild(guild_id)
+
+
+def counter(reply="reply", delay=0):
+    calls = []
+
+    async def command(*args):
+        calls.append(args)
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        return reply
+
+    return command, calls
+
+
+def test_replies_are_cached():
+    command, calls = counter()
+    cache = CommandCache()
+
+    async def test():
+        key = cache.key(Context(1), {"board": "xp"})
+
+        assert await cache.get(key, command) == "reply"
+        assert await cache.get(key, command) == "reply"
+        assert await cache.get(cache.key(Context(1), {"board": "level"}), command) == "reply"
+
+    asyncio.run(test())
+
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_none_isnt_cached():
+    command, calls = counter(None)
+    cache = CommandCache()
+
+    async def test():
+        await cache.get("key", command)
+        await cache.get("key", command)
+
+    asyncio.run(test())
+
+    assert len(calls) == 2 and len(cache) == 0
+
+
+def test_replies_expire():
+    command, calls = counter()
+    cache = CommandCache(ttl=0.1)
+
+    async def test():
+        await cache.get("key", command)
+        await cache.get("key", command)
+
+        await asyncio.sleep(0.15)
+        await cache.get("key", command)
+
+    asyncio.run(test())
+
+    assert len(calls) == 2
+
+
+def test_least_recently_used_are_removed():
+    command, calls = counter()
+    cache = CommandCache(maxsize=2)
+
+    async def test():
+        await cache.get("a", command)
+        await cache.get("b", command)
+        await cache.get("a", command)  # b is now least recently used
+        await cache.get("c", command)
+
+        assert len(cache) == 2
+
+        await cache.get("a", command)
+        await cache.get("b", command)
+
+    asyncio.run(test())
+
+    assert len(calls) == 4  # a, b, c, then b again
+
+
+def test_identical_uses_share_one_reply():
+    command, calls = counter(delay=0.05)
+    cache = CommandCache()
+
+    async def test():
+        return await asyncio.gather(*(cache.get("key", command) for _ in range(5)))
+
+    assert asyncio.run(test()) == ["reply"] * 5
+    assert len(calls) == 1
+
+
+def test_cancelled_use_doesnt_cancel_shared_reply():
+    command, calls = counter(delay=0.2)
+    cache = CommandCache()
+
+    async def test():
+        first = asyncio.ensure_future(cache.get("key", command))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get("key", command))
+        await asyncio.sleep(0.05)
+
+        first.cancel()
+
+        assert await second == "reply"
+        assert first.cancelled()
+
+        assert await cache.get("key", command) == "reply"  # cached
+
+    asyncio.run(test())
+
+    assert len(calls) == 1
+
+
+def test_reply_cancelled_when_every_use_is_cancelled():
+    command, calls = counter(delay=0.2)
+    cache = CommandCache()
+
+    async def test():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.get("key", command), 0.05)
+
+        await asyncio.sleep(0.3)
+
+        assert len(cache) == 0
+        assert await cache.get("key", command) == "reply"
+
+    asyncio.run(test())
+
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_use():
+    cache = CommandCache()
+
+    async def fails():
+        await asyncio.sleep(0.05)
+        raise ValueError("bad")
+
+    async def test():
+        results = await asyncio.gather(cache.get("key", fails), cache.get("key", fails), return_exceptions=True)
+
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert len(cache) == 0
+
+    asyncio.run(test())
+
+
+def test_invalidate():
+    command, calls = counter()
+    cache = CommandCache(scope="guild")
+
+    async def test():
+        for guild_id in (1, 2):
+            for board in ("xp", "level"):
+                await cache.get(cache.key(Context(guild_id), {"board": board}), command)
+
+        cache.invalidate(Guild(1), board="xp")
+        assert len(cache) == 3
+        assert cache.key(Context(1), {"board": "xp"}) not in cache._entries
+
+        cache.invalidate(board="level")
+        assert len(cache) == 1
+
+        cache.invalidate(2)
+        assert len(cache) == 0
+
+    asyncio.run(test())
@@ -0,0 +1,188 @@
+import asyncio
+import random
+
+import pytest
+
+from detache.counters import CounterBackend, CounterStore, Leaderboard, SQLiteBackend, _SortedList
+
+
+class MemoryBackend(CounterBackend):
+    def __init__(self, saved=None):
+        self.saved = saved or {}
+        self.batches = []
+        self.closed = False
+
+    async def load(self):
+        return {name: dict(values) for name, values in self.saved.items()}
+
+    async def write(self, rows):
+        self.batches.append(sorted(rows, key=repr))
+
+        for name, key, value in rows:
+            self.saved.setdefault(name, {})[key] = value
+
+    async def close(self):
+        self.closed = True
+
+
+def test_top():
+    board = Leaderboard("xp")
+
+    for key, value in [("a", 5), ("b", 20), ("c", 1), ("d", 12)]:
+        board.set(key, value)
+
+    board.incr("c", 30)
+
+    assert board.top(2) == [("c", 31), ("b", 20)]
+    assert board.top(10, offset=2) == [("d", 12), ("a", 5)]
+    assert board.top(10, offset=10) == []
+
+
+def test_ties_share_a_rank_and_keep_their_order():
+    board = Leaderboard("xp")
+
+    board.set("late", 1)
+    board.set("first", 10)
+    board.set("second", 10)
+    board.incr("late", 9)  # reaches 10 last
+
+    assert board.top() == [("first", 10), ("second", 10), ("late", 10)]
+    assert [board.rank(key) for key in ("first", "second", "late")] == [1, 1, 1]
+
+    board.set("low", 3)
+    board.incr("second")
+
+    assert board.rank("second") == 1
+    assert board.rank("first") == board.rank("late") == 2
+    assert board.rank("low") == 4
+    assert board.rank("missing") is None
+
+
+def test_mixed_key_types():
+    board = Leaderboard("xp")
+
+    board.set(1, 5)
+    board.set("1", 5)
+    board.set((1, 2), 5)
+
+    assert [key for key, value in board.top()] == [1, "1", (1, 2)]
+
+
+def test_matches_sorting(monkeypatch):
+    monkeypatch.setattr(_SortedList, "load", 4)  # lots of buckets
+
+    rand = random.Random(0)
+    board = Leaderboard("xp")
+    board._load({key: rand.randrange(20) for key in range(30)})
+
+    for _ in range(2000):
+        board.incr(rand.randrange(60), rand.randrange(-5, 10))
+
+        values = board._values
+
+        expected = sorted(values.values(), reverse=True)
+        assert [value for key, value in board.top(len(values))] == expected
+
+        key = rand.choice(list(values))
+        assert board.rank(key) == expected.index(values[key]) + 1
+
+
+def test_flush_writes_changed_counters_in_one_batch():
+    backend = MemoryBackend({"xp": {"a": 1}})
+
+    async def test():
+        store = CounterStore(backend, interval=60)
+        await store.start()
+
+        assert store.leaderboard("xp")["a"] == 1
+
+        for _ in range(100):
+            store.incr("xp", "a")
+            store.incr("xp", "b", 2)
+        store.incr("messages", "a")
+
+        await store.flush()
+        await store.flush()  # nothing changed
+
+        assert backend.batches == [[("messages", "a", 1), ("xp", "a", 101), ("xp", "b", 200)]]
+        assert store.metrics()["rows_written"] == 3
+
+        store.incr("xp", "b")
+        await store.close()
+
+    asyncio.run(test())
+
+    assert backend.batches[1] == [("xp", "b", 201)]
+    assert backend.closed
+
+
+def test_flush_every_interval():
+    backend = MemoryBackend()
+
+    async def test():
+        store = CounterStore(backend, interval=0.05)
+        await store.start()
+
+        store.incr("xp", "a")
+        await asyncio.sleep(0.2)
+
+        assert backend.batches == [[("xp", "a", 1)]]
+
+        await store.close()
+
+    asyncio.run(test())
+
+
+def test_failed_flush_is_retried():
+    class Failing(MemoryBackend):
+        fail = True
+
+        async def write(self, rows):
+            if self.fail:
+                self.fail = False
+                raise OSError("disk full")
+
+            await super().write(rows)
+
+    backend = Failing()
+
+    async def test():
+        store = CounterStore(backend)
+        await store.start()
+
+        store.incr("xp", "a")
+
+        with pytest.raises(OSError):
+            await store.flush()
+
+        await store.close()
+
+    asyncio.run(test())
+
+    assert backend.saved == {"xp": {"a": 1}}
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "counters.db")
+
+    async def write():
+        store = CounterStore(SQLiteBackend(path))
+        await store.start()
+
+        store.incr("xp", 1, 5)
+        store.incr("xp", (2, "guild"), 7)
+
+        await store.close()
+
+    async def read():
+        store = CounterStore(SQLiteBackend(path))
+        await store.start()
+
+        try:
+            return store.leaderboard("xp").top()
+        finally:
+            await store.close()
+
+    asyncio.run(write())
+
+    assert asyncio.run(read()) == [((2, "guild"), 7), (1, 5)]
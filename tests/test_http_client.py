@@ -0,0 +1,219 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from detache.http_client import HTTPClient, ResponseCache
+
+
+def serve(routes, test, **client_options):
+    # runs test(client, url) against a local server with the given {path: handler} routes
+
+    async def main():
+        app = web.Application()
+        for path, handler in routes.items():
+            app.router.add_route("*", path, handler)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        client = HTTPClient(**client_options)
+
+        try:
+            return await test(client, "http://127.0.0.1:{}".format(port))
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def flaky(failures, status=503, headers=None):
+    # handler that fails the first failures requests
+    calls = []
+
+    async def handler(request):
+        calls.append(time.monotonic())
+
+        if len(calls) <= failures:
+            return web.Response(status=status, headers=headers)
+
+        return web.Response(text="ok")
+
+    return handler, calls
+
+
+def test_retries_failed_gets():
+    handler, calls = flaky(2)
+
+    async def test(client, url):
+        response = await client.get(url + "/")
+
+        assert response.status == 200
+        assert await response.text() == "ok"
+
+    serve({"/": handler}, test, backoff=0.01)
+
+    assert len(calls) == 3
+
+
+def test_doesnt_retry_posts():
+    handler, calls = flaky(2)
+
+    async def test(client, url):
+        assert (await client.post(url + "/")).status == 503
+
+    serve({"/": handler}, test, backoff=0.01)
+
+    assert len(calls) == 1
+
+
+def test_uses_retry_after():
+    handler, calls = flaky(1, 429, {"Retry-After": "0.2"})
+
+    async def test(client, url):
+        assert (await client.get(url + "/")).status == 200
+
+    serve({"/": handler}, test, backoff=0.01)
+
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_long_retry_after_isnt_waited_for():
+    handler, calls = flaky(1, 429, {"Retry-After": "3600"})
+
+    async def test(client, url):
+        start = time.monotonic()
+        response = await client.get(url + "/")
+
+        assert response.status == 429
+        assert time.monotonic() - start < 1
+
+    serve({"/": handler}, test, max_retry_after=5)
+
+    assert len(calls) == 1
+
+
+def test_timeout_covers_retries():
+    handler, calls = flaky(100)
+
+    async def test(client, url):
+        start = time.monotonic()
+        response = await client.get(url + "/")
+
+        # the next wait would pass the deadline, so the last response is returned
+        assert response.status == 503
+        assert time.monotonic() - start < 1
+
+    serve({"/": handler}, test, timeout=0.5, retries=10, backoff=0.1)
+
+    assert 1 < len(calls) < 10
+
+
+def test_timeout_covers_slow_attempts():
+    async def slow(request):
+        await asyncio.sleep(0.2)
+        return web.Response(status=503)
+
+    async def test(client, url):
+        start = time.monotonic()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get(url + "/")
+
+        assert time.monotonic() - start < 0.6
+
+    serve({"/": slow}, test, timeout=0.5, retries=10, backoff=0.01)
+
+
+def test_coalesces_identical_gets():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return web.Response(text="ok")
+
+    async def test(client, url):
+        responses = await asyncio.gather(*(client.get(url + "/") for _ in range(10)))
+
+        assert all(response is responses[0] for response in responses)
+
+    serve({"/": handler}, test)
+
+    assert len(calls) == 1
+
+
+def test_cancelled_caller_doesnt_cancel_shared_get():
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.3)
+        return web.Response(text="ok")
+
+    async def test(client, url):
+        other = asyncio.ensure_future(client.get(url + "/"))
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.get(url + "/"), 0.1)
+
+        response = await other
+
+        assert await response.text() == "ok"
+
+    serve({"/": handler}, test)
+
+    assert len(calls) == 1
+
+
+def test_shared_get_cancelled_when_every_caller_leaves():
+    started = []
+    finished = []
+
+    async def handler(request):
+        started.append(request)
+        await asyncio.sleep(0.3)
+        finished.append(request)
+        return web.Response(text="ok")
+
+    async def test(client, url):
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(asyncio.gather(client.get(url + "/"), client.get(url + "/")), 0.1)
+
+        assert len(client._inflight) == 0
+
+        assert await (await client.get(url + "/")).text() == "ok"
+
+    serve({"/": handler}, test)
+
+    assert len(started) == 3 and len(finished) == 1
+
+
+def test_revalidates_with_etag():
+    calls = []
+
+    async def handler(request):
+        calls.append(request.headers.get("If-None-Match"))
+
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304, headers={"ETag": '"v1"'})
+
+        return web.Response(text="ok", headers={"ETag": '"v1"'})
+
+    async def test(client, url):
+        first = await client.get(url + "/")
+        second = await client.get(url + "/")
+
+        assert first.status == second.status == 200
+        assert await second.text() == "ok"
+
+    serve({"/": handler}, test, cache=ResponseCache())
+
+    assert calls == [None, '"v1"']
@@ -0,0 +1,279 @@
+import asyncio
+
+import pytest
+
+from detache import errors, resources
+from detache.resources import Pool, Resource, ResourceRegistry
+
+
+def run(test):
+    return asyncio.run(test())
+
+
+def counting(factory):
+    # wraps a factory to keep the connections it opened
+    opened = []
+
+    async def wrapped():
+        connection = await factory()
+        opened.append(connection)
+
+        return connection
+
+    return wrapped, opened
+
+
+def test_queries_through_pool():
+    async def test():
+        pool = Pool("db", resources.sqlite(":memory:"), size=2)
+
+        async with pool.acquire() as db:
+            await db.execute("CREATE TABLE uses (command TEXT)")
+            await db.executemany("INSERT INTO uses VALUES (?)", [("a",), ("b",)])
+            await db.commit()
+
+            assert await db.execute("SELECT count(*) FROM uses") == [(2,)]
+
+        await pool.close()
+
+    run(test)
+
+
+def test_size_bound_and_reuse():
+    factory, opened = counting(resources.sqlite(":memory:"))
+
+    async def test():
+        pool = Pool("db", factory, size=2)
+        active = []
+        most = 0
+
+        async def use():
+            nonlocal most
+
+            async with pool.acquire() as db:
+                active.append(db)
+                most = max(most, len(active))
+
+                await db.execute("SELECT 1")
+                await asyncio.sleep(0.01)
+
+                active.remove(db)
+
+        await asyncio.gather(*(use() for _ in range(10)))
+
+        assert most == 2
+        assert len(opened) == 2
+        assert pool.metrics()["opened"] == 2 and pool.metrics()["in_use"] == 0
+
+        await pool.close()
+
+    run(test)
+
+
+def test_waiters_are_served_in_order():
+    async def test():
+        pool = Pool("db", resources.sqlite(":memory:"), size=1)
+        order = []
+
+        db = await pool.acquire()
+
+        async def wait(n):
+            resource = await pool.acquire()
+            order.append(n)
+
+            pool.release(resource)
+
+        waiters = [asyncio.ensure_future(wait(n)) for n in range(5)]
+        await asyncio.sleep(0.01)
+
+        assert pool.metrics()["waiting"] == 5
+
+        pool.release(db)
+        await asyncio.gather(*waiters)
+
+        assert order == [0, 1, 2, 3, 4]
+
+        await pool.close()
+
+    run(test)
+
+
+def test_factory_failure_lets_a_waiter_open_one():
+    sqlite = resources.sqlite(":memory:")
+    calls = []
+
+    async def factory():
+        calls.append(None)
+
+        if len(calls) == 1:
+            await asyncio.sleep(0.01)
+            raise OSError("connection refused")
+
+        return await sqlite()
+
+    async def test():
+        pool = Pool("db", factory, size=1)
+
+        first = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(pool.acquire())  # waits, the pool is at its size
+
+        with pytest.raises(OSError):
+            await first
+
+        db = await asyncio.wait_for(second, 1)  # opened instead of waiting forever
+
+        assert pool.metrics()["opened"] == 1
+        pool.release(db)
+
+        await pool.close()
+
+    run(test)
+
+    assert len(calls) == 2
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def test():
+        pool = Pool("db", resources.sqlite(":memory:"), size=1)
+
+        db = await pool.acquire()
+
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        await asyncio.sleep(0)
+
+        assert pool.metrics()["waiting"] == 0
+
+        pool.release(db)
+        assert await pool.acquire() is db
+
+        pool.release(db)
+        await pool.close()
+
+    run(test)
+
+
+def test_waiter_cancelled_after_handover_passes_it_on():
+    async def test():
+        pool = Pool("db", resources.sqlite(":memory:"), size=1)
+
+        db = await pool.acquire()
+
+        first = asyncio.ensure_future(pool.acquire())
+        second = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+
+        pool.release(db)  # handed to first
+        first.cancel()  # before first got to run
+
+        assert await asyncio.wait_for(second, 1) is db
+        assert first.cancelled()
+        assert pool.metrics()["in_use"] == 1
+
+        pool.release(db)
+        await pool.close()
+
+    run(test)
+
+
+def test_close():
+    factory, opened = counting(resources.sqlite(":memory:"))
+
+    async def test():
+        pool = Pool("db", factory, size=2)
+
+        idle = await pool.acquire()
+        busy = await pool.acquire()
+        pool.release(idle)
+
+        await pool.close()
+
+        assert pool.closed
+        assert pool.metrics()["opened"] == 1  # idle one closed, busy one still open
+
+        with pytest.raises(errors.DetacheException):
+            await pool.acquire()
+
+        pool.release(busy)  # closed when released
+        await asyncio.sleep(0.05)
+
+        assert pool.metrics()["opened"] == 0
+
+    run(test)
+
+    assert all(connection._connection is None for connection in opened)
+
+
+def test_close_fails_waiters():
+    async def test():
+        pool = Pool("db", resources.sqlite(":memory:"), size=1)
+
+        db = await pool.acquire()
+
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+
+        await pool.close()
+
+        with pytest.raises(errors.DetacheException):
+            await waiter
+
+        pool.release(db)
+        await asyncio.sleep(0.05)
+
+        assert pool.metrics()["opened"] == 0
+
+    run(test)
+
+
+def test_metrics():
+    async def test():
+        pool = Pool("db", resources.sqlite(":memory:"), size=1)
+
+        db = await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0.05)
+
+        pool.release(db)
+        pool.release(await waiter)
+
+        metrics = pool.metrics()
+
+        assert metrics["acquires"] == 2
+        assert metrics["size"] == 1 and metrics["opened"] == 1
+        assert metrics["in_use"] == 0 and metrics["waiting"] == 0
+        assert metrics["max_wait"] >= 0.05 and metrics["wait_time"] >= metrics["max_wait"]
+
+        await pool.close()
+
+    run(test)
+
+
+def test_registry_shares_declared_pools():
+    async def test():
+        registry = ResourceRegistry()
+
+        first = registry.declare("db", Resource(resources.sqlite(":memory:"), size=3))
+        second = registry.declare("db", Resource(resources.sqlite(":memory:"), size=8))
+
+        assert first is second and first.size == 3
+
+        with pytest.raises(errors.DetacheException):
+            registry.add("db", resources.sqlite(":memory:"))
+
+        with pytest.raises(errors.DetacheException):
+            registry.declare("cache", None)
+
+        async with first.acquire() as db:
+            await db.execute("SELECT 1")
+
+        assert registry.metrics()["db"]["acquires"] == 1
+
+        await registry.close()
+
+        assert first.closed
+
+    run(test)
@@ -0,0 +1,66 @@
+import random
+import re
+
+from detache.triggers import AhoCorasick, TriggerIndex, _RegexSet
+from detache.wrappers import Trigger
+
+
+def test_aho_corasick_finds_overlapping_keywords():
+    automaton = AhoCorasick(["he", "she", "hers", "his"])
+
+    assert automaton.search("ushers") == {0, 1, 2}
+    assert automaton.search("nothing here") == {0}
+    assert automaton.search("xyz") == set()
+
+
+def test_regex_set_matches_like_re():
+    patterns = [r"\d+", r"ab+c", r"(x)(y)?z", r"^start", r"end$"]
+    regex_set = _RegexSet(patterns, 0)
+
+    rand = random.Random(0)
+    for _ in range(500):
+        text = "".join(rand.choice("abcxyz01 ") for _ in range(rand.randrange(20)))
+        text = rand.choice(["", "start "]) + text + rand.choice(["", " end"])
+
+        found = regex_set.search(text)
+
+        for index, pattern in enumerate(patterns):
+            expected = re.search(pattern, text)
+
+            if expected is None:
+                assert index not in found
+            else:
+                assert found[index].span() == expected.span()
+                assert found[index].groups() == expected.groups()
+
+
+def test_regex_set_backreferences():
+    regex_set = _RegexSet([r"(a)x", r"(b)\1", r"(?P<c>c)(?P=c)", r"(d)?(?(1)e|f)"], 0)
+
+    assert set(regex_set.search("bb")) == {1}
+    assert set(regex_set.search("ax cc de")) == {0, 2, 3}
+    assert regex_set.search("ab") == {}
+
+
+def test_regex_set_shared_group_names():
+    regex_set = _RegexSet([r"(?P<word>hi)", r"(?P<word>bye)"], 0)
+
+    found = regex_set.search("hi and bye")
+
+    assert found[0].group("word") == "hi"
+    assert found[1].group("word") == "bye"
+
+
+def test_trigger_index_fires_each_trigger_once():
+    index = TriggerIndex()
+
+    keyword = Trigger(None, "good bot", False, True)
+    regex = Trigger(None, r"(\w)\1{2}", True, False)
+    index.add("plugin", keyword)
+    index.add("plugin", regex)
+
+    matches = index.search("Good Bot, good bot! hmmm zzz")
+
+    assert [(trigger, match if isinstance(match, str) else match.group()) for _, trigger, match in matches] == [
+        (keyword, "good bot"), (regex, "mmm"),
+    ]